@@ -0,0 +1,185 @@
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from evolalg.base.individual import Individual
+
+
+class IndividualView:
+    """One row of an ArrayPopulation, usable wherever an Individual is read or written attribute by attribute."""
+
+    __slots__ = ("population", "index")
+
+    def __init__(self, population, index):
+        object.__setattr__(self, "population", population)
+        object.__setattr__(self, "index", index)
+
+    def __getattr__(self, name):
+        if name in IndividualView.__slots__:  # not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return self.population.get(name, self.index)
+
+    def __setattr__(self, name, value):
+        self.population.set(name, self.index, value)
+
+    def fields(self):
+        return {name: self.population.get(name, self.index) for name in self.population.field_names()}
+
+    def clone(self):
+        # a detached Individual, so that changing the clone never changes the population (see clone_individual)
+        ind = Individual.__new__(Individual)
+        ind.__dict__.update(self.fields())
+        return ind
+
+    def __repr__(self):
+        return "IndividualView(%d, %r)" % (self.index, self.fields())
+
+
+def numeric_column(values):
+    # float64 column of numbers, NaN for None; tuples (multi-objective fitness) give one row each, all-NaN for None
+    first = next((v for v in values if v is not None), None)
+    if isinstance(first, (tuple, list, np.ndarray)):
+        res = np.full((len(values), len(first)), np.nan)
+        for i, v in enumerate(values):
+            if v is not None:
+                res[i] = v
+        return res
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def _fields_of(ind):
+    if isinstance(ind, IndividualView):
+        return ind.fields()
+    return vars(ind)
+
+
+class ArrayPopulation:
+    """Population stored column by column: genotypes in a list, numeric fields (fitness by default) in float64
+    arrays with NaN for None (2D for tuples of objectives), and any other field in an object array.
+
+    Sorting, splitting and selection read the fitness array directly (see fitness_array()); code that wants
+    objects gets IndividualView rows by iterating or indexing with an int. Indexing with a slice or an index array
+    returns a new ArrayPopulation with copies of those rows.
+    """
+
+    def __init__(self, genotypes: List[str] = None, fields: Dict[str, np.ndarray] = None,
+                 numeric_fields: Iterable[str] = ("fitness",)):
+        self.genotypes = list(genotypes) if genotypes is not None else []
+        self.numeric_fields = tuple(numeric_fields)
+        self.fields = dict(fields) if fields is not None else {}
+        for name in self.numeric_fields:
+            if name not in self.fields:
+                self.fields[name] = np.full(len(self.genotypes), np.nan)
+
+    @classmethod
+    def from_individuals(cls, individuals, numeric_fields: Iterable[str] = ("fitness",)):
+        if isinstance(individuals, ArrayPopulation):
+            return individuals
+        rows = [_fields_of(ind) for ind in individuals]
+        names = list(dict.fromkeys(name for row in rows for name in row if name != "genotype"))
+        numeric_fields = tuple(numeric_fields)
+        fields = {}
+        for name in names:
+            values = [row.get(name) for row in rows]
+            if name in numeric_fields:
+                fields[name] = numeric_column(values)
+            else:
+                fields[name] = np.empty(len(values), dtype=object)
+                fields[name][:] = values
+        return cls([row["genotype"] for row in rows], fields, numeric_fields)
+
+    def to_individuals(self):
+        return [view.clone() for view in self]
+
+    @staticmethod
+    def concat(populations):
+        populations = list(populations)
+        if not populations:
+            return ArrayPopulation()
+        names = list(dict.fromkeys(name for p in populations for name in p.fields))
+        fields = {}
+        for name in names:
+            parts = [p.fields.get(name) for p in populations]
+            like = max((part for part in parts if part is not None), key=np.ndim)
+            # a missing column, or one of only None next to tuples of objectives, is filled with NaN
+            parts = [part if part is not None and part.ndim == like.ndim else p._empty_column(name, like)
+                     for p, part in zip(populations, parts)]
+            fields[name] = np.concatenate(parts)
+        return ArrayPopulation([g for p in populations for g in p.genotypes], fields, populations[0].numeric_fields)
+
+    def _empty_column(self, name, like=None):
+        if name in self.numeric_fields:
+            return np.full((len(self),) + (like.shape[1:] if like is not None else ()), np.nan)
+        return np.full(len(self), None, dtype=object)
+
+    def field_names(self):
+        return ["genotype"] + list(self.fields)
+
+    def get(self, name, index):
+        if name == "genotype":
+            return self.genotypes[index]
+        try:
+            column = self.fields[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        value = column[index]
+        if name in self.numeric_fields:
+            if np.ndim(value):  # multi-objective fitness
+                return None if np.isnan(value).all() else tuple(value.tolist())
+            return None if np.isnan(value) else float(value)
+        return value
+
+    def set(self, name, index, value):
+        if name == "genotype":
+            self.genotypes[index] = value
+            return
+        if name not in self.fields:
+            self.fields[name] = self._empty_column(name)
+        if name in self.numeric_fields:
+            self.fields[name][index] = np.nan if value is None else value
+        else:
+            self.fields[name][index] = value
+
+    def fitness_array(self, fit_attr="fitness"):
+        if fit_attr not in self.fields:
+            return np.full(len(self), np.nan)
+        return self.fields[fit_attr]
+
+    def take(self, indices):
+        indices = np.asarray(indices, dtype=np.intp)
+        return ArrayPopulation([self.genotypes[i] for i in indices.tolist()],
+                               {name: column[indices] for name, column in self.fields.items()},
+                               self.numeric_fields)
+
+    def replace(self, indices, individuals):
+        # a copy with the rows at indices replaced by individuals
+        res = self.take(np.arange(len(self)))
+        for index, ind in zip(np.asarray(indices).tolist(), individuals):
+            for name, value in _fields_of(ind).items():
+                res.set(name, index, value)
+        return res
+
+    def __len__(self):
+        return len(self.genotypes)
+
+    def __iter__(self):
+        return (IndividualView(self, i) for i in range(len(self.genotypes)))
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError(item)
+            return IndividualView(self, int(item))
+        if isinstance(item, slice):
+            return self.take(np.arange(len(self))[item])
+        return self.take(item)
+
+
+def merge_populations(populations):
+    # concatenation that keeps ArrayPopulations array-backed
+    populations = list(populations)
+    if populations and all(isinstance(p, ArrayPopulation) for p in populations):
+        return ArrayPopulation.concat(populations)
+    return [ind for p in populations for ind in p]
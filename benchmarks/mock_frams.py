@@ -0,0 +1,73 @@
+import random
+import time
+import zlib
+
+# A stand-in for FramsticksLib with the methods evolalg calls (getSimplest, mutate, crossOver, isValid, evaluate),
+# so that the overhead of the framework itself can be measured without a Framsticks installation.
+# Genotypes are strings over a small alphabet; evaluation criteria are cheap functions of the genotype.
+
+ALPHABET = "XNRrLlCcQq()"
+
+
+class MockFramsticksLib:
+    def __init__(self, eval_cost=0.0, genotype_length=20, invalid_prob=0.0, mutation_size=1, seed=None):
+        self.eval_cost = eval_cost  # CPU seconds burned per evaluated genotype, like a simulation would
+        self.genotype_length = genotype_length  # length of the genotype returned by getSimplest
+        self.invalid_prob = invalid_prob  # probability that a genotype cannot be evaluated (evaluations are None)
+        self.mutation_size = mutation_size  # number of characters changed by one mutation
+        self.rng = random.Random(seed)
+        self.evaluated = 0
+        self.mutated = 0
+
+    def getSimplest(self, genetic_format):
+        return "X" * self.genotype_length
+
+    def _mutate(self, genotype):
+        genotype = list(genotype)
+        for _ in range(self.mutation_size):
+            position = self.rng.randrange(len(genotype) + 1)
+            operation = self.rng.random()
+            if operation < 0.4 or not genotype:
+                genotype.insert(position, self.rng.choice(ALPHABET))
+            elif operation < 0.7:
+                del genotype[min(position, len(genotype) - 1)]
+            else:
+                genotype[min(position, len(genotype) - 1)] = self.rng.choice(ALPHABET)
+        return "".join(genotype)
+
+    def mutate(self, genotype_list):
+        self.mutated += len(genotype_list)
+        return [self._mutate(g) for g in genotype_list]
+
+    def crossOver(self, genotype1, genotype2):
+        cut1 = self.rng.randrange(len(genotype1) + 1)
+        cut2 = self.rng.randrange(len(genotype2) + 1)
+        return genotype1[:cut1] + genotype2[cut2:]
+
+    def isValid(self, genotype_list):
+        return [len(g) > 0 for g in genotype_list]
+
+    def _criteria(self, genotype):
+        noise = (zlib.crc32(genotype.encode()) % 1000) / 1000.0
+        return {
+            "numparts": float(genotype.count("X") + 1),
+            "numjoints": float(genotype.count("X")),
+            "numneurons": float(genotype.count("N")),
+            "numconnections": float(genotype.count("C") + genotype.count("c")),
+            "vertpos": noise,
+            "velocity": noise * genotype.count("R") / (len(genotype) + 1),
+            "distance": noise * len(genotype),
+            "lifespan": 1000.0,
+        }
+
+    def evaluate(self, genotype_list):
+        res = []
+        for i, genotype in enumerate(genotype_list):
+            if self.eval_cost > 0:
+                end = time.perf_counter() + self.eval_cost
+                while time.perf_counter() < end:
+                    pass
+            self.evaluated += 1
+            valid = len(genotype) > 0 and self.rng.random() >= self.invalid_prob
+            res.append({"num": i, "name": "mock", "evaluations": {"": self._criteria(genotype)} if valid else None})
+        return res
@@ -0,0 +1,60 @@
+import argparse
+import copy
+import time
+import tracemalloc
+
+from evolalg.base.individual import Individual
+from evolalg.utils.clone import clone_individual
+
+
+# Compares the memory allocated per offspring by the old path (TournamentSelection(copy=True) deep copy
+# followed by the deep copy in StableGeneration.generate_new) with a single clone_individual() call.
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Allocation per offspring: deepcopy vs. clone_individual.")
+    parser.add_argument('-offspring', type=int, default=10000, help="Number of offspring to create, default 10000.")
+    parser.add_argument('-genotype_length', type=int, default=200, help="Length of the genotype string, default 200.")
+    parser.add_argument('-recording_size', type=int, default=1000, help="Number of values in the custom 'recording' field, default 1000.")
+    return parser.parse_args()
+
+
+def make_parents(count, genotype_length, recording_size):
+    parents = []
+    for i in range(count):
+        ind = Individual("X" * genotype_length + str(i))
+        ind.fitness = float(i)
+        ind.recording = [[float(j), float(j), float(j)] for j in range(recording_size)]
+        parents.append(ind)
+    return parents
+
+
+def deepcopy_twice(ind):
+    return copy.deepcopy(copy.deepcopy(ind))
+
+
+def measure(create, parents, offspring):
+    tracemalloc.start()
+    start = time.perf_counter()
+    children = [create(parents[i % len(parents)]) for i in range(offspring)]
+    elapsed = time.perf_counter() - start
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del children
+    return allocated / offspring, peak / offspring, elapsed / offspring
+
+
+def main():
+    parsed_args = parseArguments()
+    parents = make_parents(100, parsed_args.genotype_length, parsed_args.recording_size)
+    print("%-16s %16s %16s %14s" % ("method", "bytes/offspring", "peak/offspring", "us/offspring"))
+    results = {}
+    for name, create in [("deepcopy x2", deepcopy_twice), ("clone", clone_individual)]:
+        allocated, peak, elapsed = measure(create, parents, parsed_args.offspring)
+        results[name] = allocated
+        print("%-16s %16.0f %16.0f %14.2f" % (name, allocated, peak, elapsed * 1e6))
+    print("allocation per offspring reduced %.1fx" % (results["deepcopy x2"] / max(results["clone"], 1)))
+
+
+if __name__ == '__main__':
+    main()
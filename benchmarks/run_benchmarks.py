@@ -0,0 +1,184 @@
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import time
+import tracemalloc
+
+from evolalg.base.union_step import UnionStep
+from evolalg.fitness.fitness_step import FitnessStep
+from evolalg.multiexperiment import MultiExperiment
+from evolalg.mutation_cross.frams_cross_and_mutate import FramsCrossAndMutate
+from evolalg.population.frams_population import FramsPopulation
+from evolalg.repair.remove.field import FieldRemove
+from evolalg.selection.convection import ConvectionSelection
+from evolalg.selection.tournament import TournamentSelection
+from evolalg.statistics.streaming_statistics import StreamingStatistics
+from evolalg.utils.instrumentation import Instrumentation
+
+from mock_frams import MockFramsticksLib
+
+# Sweeps MultiExperiment settings on MockFramsticksLib and appends one JSON line per configuration to the results
+# file, tagged with the current git commit, e.g.:
+#   python run_benchmarks.py -popsize 100,1000 -subpopnum 1,5 -splitmethod ena,era,ewa
+#   python run_benchmarks.py -compare
+
+
+SWEPT = ["popsize", "subpopnum", "whenmerge", "splitmethod"]
+CONFIG_KEYS = SWEPT + ["generations", "tournament", "selection", "opt", "eval_cost", "genotype_length",
+                       "invalid_prob", "seed"]
+
+
+def int_list(string):
+    return [int(x) for x in string.split(",")]
+
+
+def str_list(string):
+    return string.split(",")
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Benchmark of the framework overhead with a mock Framsticks library.")
+    parser.add_argument('-popsize', type=int_list, default=[100, 1000], help="Comma-separated population sizes, default 100,1000.")
+    parser.add_argument('-subpopnum', type=int_list, default=[1, 5], help="Comma-separated numbers of subpopulations, default 1,5.")
+    parser.add_argument('-whenmerge', type=int_list, default=[5], help="Comma-separated merge intervals, default 5.")
+    parser.add_argument('-splitmethod', type=str_list, default=["ena", "era", "ewa"], help="Comma-separated splitting methods, default ena,era,ewa.")
+    parser.add_argument('-generations', type=int, default=20, help="Generations per run, default 20.")
+    parser.add_argument('-tournament', type=int, default=5, help="Tournament size, default 5.")
+    parser.add_argument('-selection', default="tournament", choices=["tournament", "convection"], help="Selection, default tournament.")
+    parser.add_argument('-opt', default="velocity", help="Optimized criterion of the mock library, default velocity.")
+    parser.add_argument('-eval_cost', type=float, default=0.0, help="CPU seconds per evaluation, default 0 (pure framework overhead).")
+    parser.add_argument('-genotype_length', type=int, default=20, help="Length of the initial genotype, default 20.")
+    parser.add_argument('-invalid_prob', type=float, default=0.05, help="Probability that an evaluation fails, default 0.05.")
+    parser.add_argument('-seed', type=int, default=1, help="Random seed, default 1.")
+    parser.add_argument('-repeats', type=int, default=1, help="Runs of every configuration, default 1.")
+    parser.add_argument('-tracemalloc', action='store_true', help="Also measure the peak of Python allocations (slows the run down).")
+    parser.add_argument('-results', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl"),
+                        help="JSONL file the results are appended to, default benchmarks/results.jsonl.")
+    parser.add_argument('-label', default=None, help="Free-form label stored with the results.")
+    parser.add_argument('-compare', action='store_true', help="Do not run anything, print generations/sec of the stored results per commit.")
+    return parser.parse_args()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_experiment(frams, config, instrumentation):
+    fitness_remove = UnionStep([
+        FitnessStep(frams, fields={config["opt"]: "fitness"}, fields_defaults={config["opt"]: None}),
+        FieldRemove("fitness", None)
+    ])
+    if config["selection"] == "convection":
+        selection = ConvectionSelection(config["tournament"], config["subpopnum"], fit_attr="fitness")
+    else:
+        selection = TournamentSelection(config["tournament"], copy=False, fit_attr="fitness")
+    return MultiExperiment(init_population=[FramsPopulation(frams, "1", config["popsize"]), fitness_remove],
+                           selection=selection,
+                           new_generation_steps=[FramsCrossAndMutate(frams, cross_prob=0.2, mutate_prob=0.9),
+                                                 fitness_remove],
+                           generation_modification=[],
+                           end_steps=[],
+                           population_size=config["popsize"],
+                           tournament_size=config["tournament"],
+                           when_merge=config["whenmerge"],
+                           subpop_num=config["subpopnum"],
+                           split_method=config["splitmethod"],
+                           seed=config["seed"],
+                           instrumentation=instrumentation,
+                           statistics=StreamingStatistics(10))
+
+
+def run_config(config, trace_memory=False):
+    # executed in a fresh process for every configuration, so that peak memory is not inherited from other runs
+    frams = MockFramsticksLib(config["eval_cost"], config["genotype_length"], config["invalid_prob"],
+                              seed=config["seed"])
+    instrumentation = Instrumentation()
+    experiment = build_experiment(frams, config, instrumentation)
+    if trace_memory:
+        tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):  # MultiExperiment prints its progress
+        experiment.init()
+        evaluated = frams.evaluated
+        start = time.perf_counter()
+        experiment.run(config["generations"])
+        wall = time.perf_counter() - start
+    evaluated = frams.evaluated - evaluated
+    res = {
+        "wall": wall,
+        "generations_per_sec": config["generations"] / wall,
+        "evaluations_per_sec": evaluated / wall,
+        "evaluations": evaluated,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "offspring": experiment.generation_counters(),
+        "stages": {stage: {"wall_per_generation": totals["wall"] / config["generations"],
+                           "calls": totals["calls"]}
+                   for stage, totals in instrumentation.summary().items()},
+    }
+    if trace_memory:
+        res["peak_traced_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return res
+
+
+def configurations(parsed_args):
+    for values in itertools.product(*(getattr(parsed_args, key) for key in SWEPT)):
+        config = {key: getattr(parsed_args, key) for key in CONFIG_KEYS}
+        config.update(zip(SWEPT, values))
+        yield config
+
+
+def config_key(config):
+    return " ".join("%s=%s" % (key, config[key]) for key in CONFIG_KEYS)
+
+
+def compare(results_path):
+    with open(results_path) as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+    commits = list(dict.fromkeys(row["commit"] for row in rows))
+    table = {}
+    for row in rows:
+        table.setdefault(config_key(row["config"]), {}).setdefault(row["commit"], []).append(
+            row["result"]["generations_per_sec"])
+    print("generations/sec (mean over repeats)")
+    print("\t".join(["config"] + [str(c) for c in commits]))
+    for key, per_commit in table.items():
+        print("\t".join([key] + ["%.2f" % (sum(per_commit[c]) / len(per_commit[c])) if c in per_commit else "-"
+                                 for c in commits]))
+
+
+def main():
+    parsed_args = parseArguments()
+    if parsed_args.compare:
+        compare(parsed_args.results)
+        return
+    commit = git_commit()
+    context = multiprocessing.get_context("spawn")
+    print("%-60s %10s %10s %12s" % ("config", "gen/s", "eval/s", "peak RSS MB"))
+    for config in configurations(parsed_args):
+        for repeat in range(parsed_args.repeats):
+            with context.Pool(1, maxtasksperchild=1) as pool:
+                result = pool.apply(run_config, (config, parsed_args.tracemalloc))
+            row = {"commit": commit, "time": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "label": parsed_args.label, "repeat": repeat, "config": config, "result": result}
+            with open(parsed_args.results, "a") as file:
+                file.write(json.dumps(row) + "\n")
+            print("%-60s %10.2f %10.1f %12.1f" % (" ".join("%s=%s" % (k, config[k]) for k in SWEPT),
+                                                  result["generations_per_sec"], result["evaluations_per_sec"],
+                                                  result["peak_rss_kb"] / 1024))
+            slowest = sorted(result["stages"].items(), key=lambda x: -x[1]["wall_per_generation"])[:4]
+            print("    " + ", ".join("%s %.2f ms" % (stage, s["wall_per_generation"] * 1000) for stage, s in slowest))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,33 @@
 import argparse
+import functools
+import logging
 import os
 import sys
-import numpy as np
-import pickle
 
-# TODO add new example: steadystate.py (analogous to standard.py) OR include steadysteate as a mode in this example or in niching_novelty.py
-# TODO extend both standard.py and steadystate.py to support >1 criteria (using DEAP's selNSGA2() and selSPEA2())
 # TODO add comments to all examples in this directory
-# TODO add to standard.py and steadystate.py evaluating each genotype in HOF N (configurable, default 20) times when the evolution ends, as it is in niching_novelty.py
 # TODO "-debug" mode, indent nested steps (pre++, post-- of a static counter?) and print their arguments so it is easy to see what happens during evolution
 
 
 from FramsticksLib import FramsticksLib
 from evolalg.base.union_step import UnionStep
 from evolalg.multiexperiment import MultiExperiment
+from evolalg.fitness.cached_fitness import CachedFitnessStep, EvaluationCache
 from evolalg.fitness.fitness_step import FitnessStep
+from evolalg.fitness.objectives import ObjectivesStep
+from evolalg.fitness.reevaluation import HallOfFameReevaluation
 from evolalg.mutation_cross.frams_cross_and_mutate import FramsCrossAndMutate
-from evolalg.population.frams_population import FramsPopulation
+from evolalg.population.frams_subpopulations import FramsSubpopulations
 from evolalg.repair.remove.field import FieldRemove
+from evolalg.selection.pareto_tournament import ParetoTournamentSelection
 from evolalg.selection.tournament import TournamentSelection
-from evolalg.statistics.halloffame_stats import HallOfFameStatistics
-from evolalg.statistics.statistics_deap import StatisticsDeap
+from evolalg.statistics.streaming_statistics import StreamingStatistics
+from evolalg.utils.budget_scheduler import BudgetScheduler
+from evolalg.utils.evaluator_pool import EvaluatorPool
+from evolalg.utils.migration import Migration
+from evolalg.utils.instrumentation import Instrumentation
+from evolalg.utils.population_log import PopulationLog
 from evolalg.utils.population_save import PopulationSave
+from evolalg.utils.streaming_generation import StreamingGeneration
 
 
 #sys.argv = [sys.argv[0], '-path', 'C:\\framsticks\\library\\framspy\\Framsticks50rc19', '-opt', 'numneurons']
@@ -35,13 +41,13 @@ def ensureDir(string):
         raise NotADirectoryError(string)
 
 
-def parseArguments():
+def build_parser():
     parser = argparse.ArgumentParser(
         description='Run this program with "python -u %s" if you want to disable buffering of its output.' % sys.argv[
             0])
     parser.add_argument('-path', type=ensureDir, required=True, help='Path to the Framsticks library without trailing slash.')
     parser.add_argument('-opt', required=True,
-                        help='optimization criteria : vertpos, velocity, distance, vertvel, lifespan, numjoints, numparts, numneurons, numconnections (or other as long as it is provided by the .sim file and its .expdef). Single or multiple criteria.')
+                        help='optimization criteria : vertpos, velocity, distance, vertvel, lifespan, numjoints, numparts, numneurons, numconnections (or other as long as it is provided by the .sim file and its .expdef). Single or multiple comma-separated criteria, e.g. velocity,numparts; with multiple criteria fitness is a tuple and selection, splitting and the Hall of Fame use Pareto fronts.')
     parser.add_argument('-lib', required=False, help="Filename of .so or .dll with the Framsticks library")
 
     parser.add_argument('-genformat', required=False, default="1",
@@ -55,18 +61,49 @@ def parseArguments():
     parser.add_argument('-splitmethod', type=str, default="ena", help="ena: equalNumberAllocation, ewa: equalWidthAllocation, era: equalRandomAllocation")
     parser.add_argument('-checkpoint_path', required=False, default=None, help="Path to the checkpoint file")
     parser.add_argument('-checkpoint_interval', required=False, type=int, default=100, help="Checkpoint interval")
+    parser.add_argument('-parallel', action='store_true', help="Evolve each subpopulation in its own worker process (each with its own Framsticks library instance).")
+    parser.add_argument('-migration', required=False, default=None, choices=["ring", "random", "full"], help="Island model: instead of merging every -whenmerge generations, subpopulations exchange emigrants along this topology.")
+    parser.add_argument('-migrationrate', type=float, default=0.1, help="Fraction of each island sent as emigrants. Default: 0.1.")
+    parser.add_argument('-migrationinterval', type=int, default=5, help="Generations between migrations. Default: 5.")
+    parser.add_argument('-evaluators', type=int, default=0, help="Number of evaluator processes (each with its own Framsticks library) of the streaming generation mode, in which selection and mutation overlap with evaluation. Default: 0 (StableGeneration).")
+    parser.add_argument('-steadystate', action='store_true', help="With -evaluators: steady-state evolution, every evaluated offspring immediately replaces the worst individual.")
+    parser.add_argument('-cache_size', type=int, default=0, help="Number of evaluated genotypes kept in memory to avoid evaluating the same genotype again. Default: 0 (no caching).")
+    parser.add_argument('-cache_path', required=False, default=None, help="sqlite file with evaluation results that survives restarts and is shared by all subpopulations and workers. Enables caching.")
+    parser.add_argument('-timing_log', required=False, default=None, help="JSONL (or .csv) file with wall/CPU time of every stage, per generation and subpopulation. Enables instrumentation.")
+    parser.add_argument('-profile', required=False, default=None, help="Comma-separated stage names (e.g. FitnessStep,selection) to run under cProfile; .prof files are written to the current directory.")
+    parser.add_argument('-maxrounds', type=int, default=100, help="Rounds of selection, variation and evaluation allowed to fill one generation of a subpopulation before giving up (when almost all offspring are invalid). Default: 100.")
+    parser.add_argument('-budget', action='store_true', help="Give subpopulations that improve (or are diverse) more offspring than stagnating ones, and merge when all of them stagnate (at the latest every -whenmerge generations).")
+    parser.add_argument('-patience', type=int, default=None, help="With -budget: stop the run when the best fitness did not improve for this many generations.")
+    parser.add_argument('-seedfile', required=False, default=None, help="Genotypes the initial subpopulations are copies of, e.g. the halloffame.gen of a previous run. Default: the simplest genotype of -genformat.")
+    parser.add_argument('-arraypopulation', action='store_true', help="Keep populations as arrays (genotypes in a list, fitness in a NumPy array) instead of lists of Individual objects.")
+    parser.add_argument('-seed', type=int, default=None, help="Random seed. With a fixed seed, serial and -parallel runs give the same results.")
 
+    parser.add_argument('-stats_log', required=False, default=None, help="JSONL file the fitness statistics of every subpopulation and generation are appended to.")
+    parser.add_argument('-population_log', required=False, default=None, help="Binary file the genotypes and fitness of every subpopulation are appended to after each generation (read it with PopulationLogReader).")
     parser.add_argument('-hof_size', type=int, default=10, help="Number of genotypes in Hall of Fame. Default: 10.")
-    return parser.parse_args()
+    parser.add_argument('-hof_path', default="halloffame.gen", help="File the Hall of Fame is saved to at the end. Default: halloffame.gen.")
+    parser.add_argument('-hof_evaluations', type=int, default=20, help="When the evolution ends, each Hall of Fame genotype is evaluated again up to this many times (fewer when its mean fitness is known precisely enough, see -hof_precision); the mean and variance are saved with the Hall of Fame. 0: no re-evaluation. Default: 20.")
+    parser.add_argument('-hof_precision', type=float, default=0.05, help="Re-evaluation of a genotype stops when the 95%% confidence interval of its mean fitness is narrower than this fraction of the mean (on each side). Default: 0.05.")
+    parser.add_argument('-hof_workers', type=int, default=0, help="Number of evaluator processes (each with its own Framsticks library) for the re-evaluation of the Hall of Fame. Default: 0 (evaluated in this process).")
+    return parser
+
 
+def parseArguments():
+    parser = build_parser()
+    parsed_args = parser.parse_args()
+    if len(criteria(parsed_args)) > 1 and (parsed_args.budget or parsed_args.steadystate):
+        parser.error("-budget and -steadystate need a single -opt criterion")
+    if parsed_args.parallel and parsed_args.evaluators > 0:
+        parser.error("-parallel and -evaluators cannot be combined")
+    return parsed_args
 
-def extract_fitness(ind):
-    return ind.fitness
 
+def criteria(parsed_args):
+    return parsed_args.opt.split(",")
 
-def load_experiment(path):
-    with open(path, "rb") as file:
-        experiment = pickle.load(file)
+
+def load_experiment(experiment, path):
+    experiment.load_checkpoint(path)
     print("Loaded experiment. Generation:", experiment.generation)
     return experiment
 
@@ -76,84 +113,178 @@ def print_population_count(pop):
     return pop  # Each step must return a population
 
 
-def main():
-    parsed_args = parseArguments()
-    print(parsed_args)
+def build_fitness_remove(frams_lib, parsed_args):
+    fitness_step = (
+        FitnessStep(frams_lib, fields={"velocity": "fitness", "data->recording": "recording"},
+                    fields_defaults={"velocity": None,
+                                     "data->recording": None})  # custom definitions and handling
+        if EVAL_LIFESPAN_BEHAVIOR else
+        FitnessStep(frams_lib, fields={parsed_args.opt: "fitness"}, fields_defaults={parsed_args.opt: None})
+        if len(criteria(parsed_args)) == 1 else
+        FitnessStep(frams_lib, fields={c: c for c in criteria(parsed_args)},
+                    fields_defaults={c: None for c in criteria(parsed_args)})  # combined by ObjectivesStep below
+    )
+    if parsed_args.cache_size > 0 or parsed_args.cache_path is not None:
+        # genotypes that were already evaluated are not sent to the simulator again
+        fitness_step = CachedFitnessStep(fitness_step, EvaluationCache(parsed_args.cache_size, parsed_args.cache_path),
+                                         genetic_format=parsed_args.genformat, sim=parsed_args.sim)
+    return UnionStep(
+        # evaluate performance and fitness, rename some of the fields, and remove some performance fields that we get from Framsticks, but we don't need them here
+        [fitness_step]
+        +
+        ([ObjectivesStep(criteria(parsed_args))] if len(criteria(parsed_args)) > 1 and not EVAL_LIFESPAN_BEHAVIOR else [])
+        +
+        ([FieldRemove("recording", None)] if EVAL_LIFESPAN_BEHAVIOR else [FieldRemove("fitness", None)])
+        +
+        [print_population_count]  # Stages can also be any Callable
+    )
+
+
+def build_new_generation(frams_lib, parsed_args, fitness_remove=None):
+    if fitness_remove is None:
+        fitness_remove = build_fitness_remove(frams_lib, parsed_args)
+    # StableGeneration clones the selected parents
+    selection = TournamentSelection(parsed_args.tournament, copy=False, fit_attr="fitness") \
+        if len(criteria(parsed_args)) == 1 else ParetoTournamentSelection(parsed_args.tournament, fit_attr="fitness")
+    new_generation_steps = [
+        FramsCrossAndMutate(frams_lib, cross_prob=0.2, mutate_prob=0.9),
+        fitness_remove
+    ]
+    return selection, new_generation_steps
+
+
+def worker_setup(parsed_args):
+    # executed once in each worker process of the -parallel mode
+    frams_lib = FramsticksLib(parsed_args.path, parsed_args.lib, parsed_args.sim)
+    return build_new_generation(frams_lib, parsed_args)
+
+
+def evaluator_setup(parsed_args):
+    # executed once in each evaluator process of the streaming mode
+    frams_lib = FramsticksLib(parsed_args.path, parsed_args.lib, parsed_args.sim)
+    return build_fitness_remove(frams_lib, parsed_args)
+
+
+def reevaluation_setup(parsed_args):
+    # executed once in each evaluator process of the Hall of Fame re-evaluation; repeated evaluations must not be
+    # answered from the evaluation cache
+    frams_lib = FramsticksLib(parsed_args.path, parsed_args.lib, parsed_args.sim)
+    return build_fitness_remove(frams_lib, without_cache(parsed_args))
+
+
+def without_cache(parsed_args):
+    return argparse.Namespace(**dict(vars(parsed_args), cache_size=0, cache_path=None))
+
+
+def build_experiment(frams_lib, parsed_args):
+    # fitness statistics (logged as JSON) and hall of fame, each individual is looked at once per generation
+    statistics = StreamingStatistics(parsed_args.hof_size, "fitness", log_path=parsed_args.stats_log)
 
+    fitness_remove = build_fitness_remove(frams_lib, parsed_args)
+    selection, new_generation_steps = build_new_generation(frams_lib, parsed_args, fitness_remove)
+
+    generation_modifications = []  # Or niching, novelty
+
+    # subpopulations of copies of the simplest genotype (or of -seedfile genotypes), each distinct one evaluated once
+    init_stages = [FramsSubpopulations(frams_lib, parsed_args.genformat, parsed_args.popsize // parsed_args.subpopnum,
+                                       parsed_args.subpopnum, seed_path=parsed_args.seedfile,
+                                       evaluation=fitness_remove,  # invalid seeds are removed
+                                       splitting_method=parsed_args.splitmethod),
+                   statistics]
+
+    end_steps = []
+    save_fields = {"genotype": "genotype", "fitness": "fitness", "custom": "recording"} if EVAL_LIFESPAN_BEHAVIOR \
+        else {"genotype": "genotype", "fitness": "fitness"}
+    if parsed_args.hof_evaluations > 0:
+        # evaluations are noisy: the Hall of Fame is evaluated again, in parallel with -hof_workers
+        end_steps.append(HallOfFameReevaluation(statistics.halloffame,
+                                                evaluator=build_fitness_remove(frams_lib, without_cache(parsed_args))
+                                                if parsed_args.hof_workers == 0 else None,
+                                                pool=EvaluatorPool(functools.partial(reevaluation_setup, parsed_args),
+                                                                   parsed_args.hof_workers)
+                                                if parsed_args.hof_workers > 0 else None,
+                                                max_evaluations=parsed_args.hof_evaluations,
+                                                relative_precision=parsed_args.hof_precision))
+        save_fields.update({"fitness_mean": "fitness_mean", "fitness_variance": "fitness_variance",
+                            "evaluations": "evaluations"})
+    end_steps.append(PopulationSave(parsed_args.hof_path, provider=statistics.halloffame, fields=save_fields))
+
+    generation_step = None
+    if parsed_args.evaluators > 0:
+        generation_step = StreamingGeneration(selection,
+                                              [FramsCrossAndMutate(frams_lib, cross_prob=0.2, mutate_prob=0.9)],
+                                              functools.partial(evaluator_setup, parsed_args),
+                                              population_size=parsed_args.popsize // parsed_args.subpopnum,
+                                              num_evaluators=parsed_args.evaluators,
+                                              steady_state=parsed_args.steadystate,
+                                              max_rounds=parsed_args.maxrounds)
+
+    instrumentation = None
+    if parsed_args.timing_log is not None or parsed_args.profile is not None:
+        instrumentation = Instrumentation(log_path=parsed_args.timing_log,
+                                          profile_stages=parsed_args.profile.split(",") if parsed_args.profile else ())
+
+    return MultiExperiment(init_population=init_stages,
+                           selection=selection,
+                           new_generation_steps=new_generation_steps,
+                           generation_modification=generation_modifications,
+                           end_steps=end_steps,
+                           population_size=parsed_args.popsize,
+                           when_merge=parsed_args.whenmerge,
+                           subpop_num=parsed_args.subpopnum,
+                           tournament_size=parsed_args.tournament,
+                           split_method=parsed_args.splitmethod,
+                           checkpoint_path=parsed_args.checkpoint_path,
+                           checkpoint_interval=parsed_args.checkpoint_interval,
+                           worker_setup=functools.partial(worker_setup, parsed_args) if parsed_args.parallel else None,
+                           seed=parsed_args.seed,
+                           instrumentation=instrumentation,
+                           generation_step=generation_step,
+                           statistics=statistics,
+                           array_population=parsed_args.arraypopulation,
+                           max_rounds=parsed_args.maxrounds,
+                           scheduler=BudgetScheduler(patience=parsed_args.patience) if parsed_args.budget else None,
+                           population_log=PopulationLog(parsed_args.population_log)
+                           if parsed_args.population_log is not None else None,
+                           migration=Migration(parsed_args.migration, parsed_args.migrationrate,
+                                               parsed_args.migrationinterval,
+                                               seed=parsed_args.seed if parsed_args.seed is not None else 0)
+                           if parsed_args.migration is not None else None
+                           )
+
+
+def run_experiment(experiment, parsed_args):
+    # continues from the checkpoint if there is one
     if parsed_args.checkpoint_path is not None and os.path.exists(parsed_args.checkpoint_path):
-        experiment = load_experiment(parsed_args.checkpoint_path)
-        FramsticksLib(parsed_args.path, parsed_args.lib,
-                      parsed_args.sim)
+        load_experiment(experiment, parsed_args.checkpoint_path)
     else:
-        frams_lib = FramsticksLib(parsed_args.path, parsed_args.lib, parsed_args.sim)
-
-        hall_of_fame = HallOfFameStatistics(parsed_args.hof_size, "fitness")
-        statistics_union = UnionStep([
-            hall_of_fame,
-            StatisticsDeap([
-                ("avg", np.mean),
-                ("stddev", np.std),
-                ("min", np.min),
-                ("max", np.max),
-                ("count", len)
-            ], extract_fitness)
-        ])
-
-        fitness_remove = UnionStep(
-            # evaluate performance and fitness, rename some of the fields, and remove some performance fields that we get from Framsticks, but we don't need them here
-            [
-                FitnessStep(frams_lib, fields={"velocity": "fitness", "data->recording": "recording"},
-                            fields_defaults={"velocity": None,
-                                             "data->recording": None})  # custom definitions and handling
-                if EVAL_LIFESPAN_BEHAVIOR else
-                FitnessStep(frams_lib, fields={parsed_args.opt: "fitness"}, fields_defaults={parsed_args.opt: None})
-            ]
-            +
-            ([FieldRemove("recording", None)] if EVAL_LIFESPAN_BEHAVIOR else [FieldRemove("fitness", None)])
-            +
-            [print_population_count]  # Stages can also be any Callable
-        )
-
-        selection = TournamentSelection(parsed_args.tournament, copy=True, fit_attr="fitness")
-        new_generation_steps = [
-            FramsCrossAndMutate(frams_lib, cross_prob=0.2, mutate_prob=0.9),
-            fitness_remove
-        ]
-
-        generation_modifications = [
-            statistics_union  # Or niching, novelty
-        ]
-
-        init_stages = [FramsPopulation(frams_lib, parsed_args.genformat, parsed_args.popsize),
-                       fitness_remove,  # It is possible to create smaller population
-                       statistics_union]
-
-        end_steps = [PopulationSave("halloffame.gen", provider=hall_of_fame.halloffame,
-                                    fields={"genotype": "genotype", "fitness": "fitness", "custom": "recording"}
-                                    if EVAL_LIFESPAN_BEHAVIOR
-                                    else {"genotype": "genotype", "fitness": "fitness"}
-                                    )]
-
-        experiment = MultiExperiment(init_population=init_stages,
-                                     selection=selection,
-                                     new_generation_steps=new_generation_steps,
-                                     generation_modification=generation_modifications,
-                                     end_steps=end_steps,
-                                     population_size=parsed_args.popsize,
-                                     when_merge=parsed_args.whenmerge,
-                                     subpop_num=parsed_args.subpopnum,
-                                     tournament_size=parsed_args.tournament,
-                                     split_method=parsed_args.splitmethod,
-                                     checkpoint_path=parsed_args.checkpoint_path,
-                                     checkpoint_interval=parsed_args.checkpoint_interval
-                                     )
-
         experiment.init()
-
     experiment.run(parsed_args.generations)
+    return experiment
+
+
+def main():
+    parsed_args = parseArguments()
+    print(parsed_args)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    frams_lib = FramsticksLib(parsed_args.path, parsed_args.lib, parsed_args.sim)
+    experiment = run_experiment(build_experiment(frams_lib, parsed_args), parsed_args)
+
+    # with -evaluators the offspring are evaluated by the caches of the evaluator processes, which are not counted
+    cache_stats = experiment.evaluation_cache_stats() if parsed_args.evaluators == 0 else None
+    if cache_stats is not None:
+        print("Evaluation cache:", cache_stats)
+    counters = experiment.generation_counters()
+    if counters:
+        print("Offspring: %(evaluations)d evaluated, %(accepted)d accepted, %(rejected)d rejected, "
+              "%(surplus)d accepted but not needed, %(rounds)d rounds in %(calls)d generations" % counters)
+    if experiment.instrumentation.enabled:
+        for stage, totals in experiment.instrumentation.summary().items():
+            print("%-24s %s" % (stage, totals))
+        experiment.instrumentation.dump_profiles(".")
     #for ind in experiment.end_steps. #experiment.hall_of_fame.halloffame:
     #    print("%g\t%s" % (ind.fitness, ind.genotype))
 
-
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,118 @@
+import argparse
+import contextlib
+import functools
+import os
+
+import numpy as np
+
+from FramsticksLib import FramsticksLib
+from evolalg.utils.pareto import objective_values
+from evolalg.utils.sweep import Sweep, grid, run_id
+
+import multistandard
+
+# Runs multistandard.py for every combination of the given parameter values and replicate seeds, e.g.:
+#   python multisweep.py -path ... -opt velocity -grid subpopnum=1,5 whenmerge=3,10 splitmethod=ena,ewa -seeds 1,2,3
+# Every worker process loads FramsticksLib once and runs one experiment after another. Each run writes its
+# checkpoint, log, statistics and hall of fame to -sweep_dir, and one row to -sweep_dir/results.csv when it ends.
+# Running the same command again skips finished runs and resumes the unfinished ones from their checkpoints
+# (written every -sweep_checkpoint_interval generations); a run interrupted before its first checkpoint starts over.
+
+RESULT_FIELDS = ["generations", "best_fitness", "mean_fitness", "evaluations", "running_time", "best_genotype"]
+
+
+def parseArguments():
+    parser = multistandard.build_parser()
+    parser.description = "Parameter sweep of multistandard.py on a pool of workers that keep the Framsticks library loaded."
+    parser.add_argument('-grid', nargs='+', required=True, metavar="NAME=VALUES",
+                        help="Swept parameters of multistandard.py with comma-separated values, e.g. subpopnum=1,5 splitmethod=ena,ewa.")
+    parser.add_argument('-seeds', default="1", help="Comma-separated random seeds, every configuration is run once for each. Default: 1.")
+    parser.add_argument('-workers', type=int, default=None, help="Number of worker processes. Default: the number of CPUs.")
+    parser.add_argument('-sweep_dir', default="sweep", help="Directory for the results table and the files of every run. Default: sweep.")
+    parser.add_argument('-sweep_checkpoint_interval', type=int, default=1, help="Generations between the checkpoints of every run, from which an interrupted run is resumed. Default: 1.")
+    parsed_args = parser.parse_args()
+    parsed_args.grid = parse_grid(parser, parsed_args)
+    generations = min(parsed_args.grid.get("generations", [parsed_args.generations]))
+    if not 0 < parsed_args.sweep_checkpoint_interval <= generations:
+        parser.error("-sweep_checkpoint_interval must be between 1 and -generations (%d), otherwise runs never "
+                     "write a checkpoint to resume from" % generations)
+    return parsed_args
+
+
+def parse_grid(parser, parsed_args):
+    # values are converted as the option itself would convert them; flags (store_true) take true/false
+    actions = {action.dest: action for action in parser._actions}
+    parameters = {}
+    for item in parsed_args.grid:
+        name, _, values = item.partition("=")
+        if not values or name not in actions or not hasattr(parsed_args, name):
+            parser.error("-grid expects NAME=VALUES with a parameter of multistandard.py, got '%s'" % item)
+        parameters[name] = [grid_value(parser, actions[name], v) for v in values.split(",")]
+    return parameters
+
+
+def grid_value(parser, action, value):
+    if action.nargs == 0:  # a flag
+        if value.lower() not in ("true", "false"):
+            parser.error("-grid: %s is a flag, its values are true or false, got '%s'" % (action.dest, value))
+        return value.lower() == "true"
+    try:
+        converted = action.type(value) if action.type is not None else value
+    except (TypeError, ValueError):
+        parser.error("-grid: invalid value '%s' of %s" % (value, action.dest))
+    if action.choices is not None and converted not in action.choices:
+        parser.error("-grid: %s must be one of %s, got '%s'"
+                     % (action.dest, ", ".join(map(str, action.choices)), value))
+    return converted
+
+
+def setup(parsed_args):
+    # executed once in each worker
+    return FramsticksLib(parsed_args.path, parsed_args.lib, parsed_args.sim)
+
+
+def run_one(parsed_args, frams_lib, config):
+    run = run_id(config)
+    args = argparse.Namespace(**vars(parsed_args))
+    for name, value in config.items():
+        setattr(args, name, value)
+    args.checkpoint_path = os.path.join(parsed_args.sweep_dir, run + ".checkpoint")
+    args.checkpoint_interval = parsed_args.sweep_checkpoint_interval
+    args.hof_path = os.path.join(parsed_args.sweep_dir, run + ".gen")
+    args.stats_log = os.path.join(parsed_args.sweep_dir, run + ".stats.jsonl")
+    if parsed_args.population_log is not None:
+        args.population_log = os.path.join(parsed_args.sweep_dir, run + ".population")
+    args.parallel = False  # the workers of the sweep already use the cores (and cannot start processes)
+    args.evaluators = 0
+    args.hof_workers = 0
+    log_path = os.path.join(parsed_args.sweep_dir, run + ".log")
+    if not os.path.exists(args.checkpoint_path):
+        # the run starts (again) from generation 0, files of an interrupted attempt would get a second copy
+        for path in [log_path, args.stats_log] + ([args.population_log, args.population_log + ".index"]
+                                                 if args.population_log is not None else []):
+            if os.path.exists(path):
+                os.remove(path)
+    with open(log_path, "a") as log, contextlib.redirect_stdout(log):
+        experiment = multistandard.run_experiment(multistandard.build_experiment(frams_lib, args), args)
+    halloffame = experiment.statistics.halloffame
+    fitness = objective_values(experiment.population)  # one column per criterion for multiple -opt criteria
+    return {"generations": experiment.generation,
+            "best_fitness": halloffame[0].fitness if halloffame else None,
+            "best_genotype": halloffame[0].genotype if halloffame else None,
+            "mean_fitness": np.nanmean(fitness, axis=0).tolist() if len(fitness) else None,
+            "evaluations": experiment.generation_counters().get("evaluations"),
+            "running_time": experiment.running_time}
+
+
+def main():
+    parsed_args = parseArguments()
+    os.makedirs(parsed_args.sweep_dir, exist_ok=True)
+    seeds = [int(s) for s in parsed_args.seeds.split(",")]
+    sweep = Sweep(functools.partial(setup, parsed_args), functools.partial(run_one, parsed_args),
+                  num_workers=parsed_args.workers, results_path=os.path.join(parsed_args.sweep_dir, "results.csv"),
+                  result_fields=RESULT_FIELDS)
+    sweep.run(grid(parsed_args.grid, seeds))
+
+
+if __name__ == '__main__':
+    main()
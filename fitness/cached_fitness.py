@@ -0,0 +1,163 @@
+import hashlib
+import pickle
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from evolalg.base.individual import Individual
+from evolalg.base.step import Step
+
+
+class EvaluationCache:
+    """Genotype -> evaluated fields, with LRU eviction in memory and an optional sqlite store on disk.
+
+    The disk store survives restarts and can be shared by several steps and processes (subpopulations,
+    parallel workers, subsequent runs) by giving them the same path.
+    """
+
+    def __init__(self, max_size=100000, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._db = None
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=60)
+            self._db.execute("PRAGMA journal_mode=WAL")  # concurrent readers while another process writes
+            self._db.execute("CREATE TABLE IF NOT EXISTS evaluations (key TEXT PRIMARY KEY, value BLOB)")
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, dict]:
+        keys = list(keys)
+        found = {}
+        not_in_memory = []
+        for key in keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+            else:
+                not_in_memory.append(key)
+        if not_in_memory and self.path is not None:
+            db = self._connection()
+            for start in range(0, len(not_in_memory), 500):  # stay below the sqlite limit of query parameters
+                chunk = not_in_memory[start:start + 500]
+                rows = db.execute("SELECT key, value FROM evaluations WHERE key IN (%s)" % ",".join("?" * len(chunk)),
+                                  chunk).fetchall()
+                for key, value in rows:
+                    value = pickle.loads(value)
+                    found[key] = value
+                    self._remember(key, value)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, dict]):
+        for key, value in items.items():
+            self._remember(key, value)
+        if items and self.path is not None:
+            db = self._connection()
+            db.executemany("INSERT OR REPLACE INTO evaluations (key, value) VALUES (?, ?)",
+                           [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) for key, value in items.items()])
+            db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._memory),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_db"] = None  # connections cannot be pickled, the copy reconnects when needed
+        return state
+
+
+class CachedFitnessStep(Step):
+    """Puts an EvaluationCache in front of a FitnessStep.
+
+    Only genotypes missing from the cache are evaluated, and each distinct genotype of a batch only once.
+    Cache keys combine the genotype with the genetic format, the .sim settings and the optimization criteria,
+    so that one disk store can hold the results of differently configured experiments.
+    """
+
+    def __init__(self, fitness_step, cache: EvaluationCache = None, genetic_format=None, sim=None, criteria=None,
+                 *args, **kwargs):
+        super(CachedFitnessStep, self).__init__(*args, **kwargs)
+        self.fitness_step = fitness_step
+        self.cache = cache if cache is not None else EvaluationCache()
+        self.attributes = list(fitness_step.fields.values())  # fields that the FitnessStep sets on individuals
+        if criteria is None:
+            criteria = sorted(fitness_step.fields)
+        self.context = "\0".join([str(genetic_format), str(sim), ",".join(criteria)])
+        self.evaluated = 0  # genotypes actually sent to the simulator
+        self.deduplicated = 0  # repeated genotypes of a batch that were not evaluated again
+
+    def init(self):
+        if isinstance(self.fitness_step, Step):
+            self.fitness_step.init()
+
+    def key(self, genotype):
+        return hashlib.blake2b((self.context + "\0" + genotype).encode(), digest_size=16).hexdigest()
+
+    def call(self, population):
+        keys = [self.key(ind.genotype) for ind in population]
+        genotypes = dict(zip(keys, (ind.genotype for ind in population)))  # one entry per distinct genotype
+        self.deduplicated += len(keys) - len(genotypes)
+        values = self.cache.get_many(list(genotypes))
+
+        missing = [key for key in genotypes if key not in values]
+        if missing:
+            probes = [Individual(genotypes[key]) for key in missing]
+            self.fitness_step(probes)  # FitnessStep sets the evaluated fields on the probes
+            evaluated = {key: {attr: getattr(probe, attr, None) for attr in self.attributes}
+                         for key, probe in zip(missing, probes)}
+            self.cache.put_many(evaluated)
+            values.update(evaluated)
+            self.evaluated += len(missing)
+
+        for ind, key in zip(population, keys):
+            for attr, value in values[key].items():
+                setattr(ind, attr, value)
+        return population
+
+    def stats(self):
+        res = self.cache.stats()
+        res.update({"evaluated": self.evaluated, "deduplicated": self.deduplicated})
+        return res
+
+
+def find_cached_steps(step) -> List[CachedFitnessStep]:
+    # CachedFitnessSteps nested anywhere in step: in the steps of (Union)Steps or wrapped by an InstrumentedStep
+    if isinstance(step, CachedFitnessStep):
+        return [step]
+    steps = getattr(step, "steps", None)  # a list, or one step (e.g. the UnionStep of a StableGeneration)
+    res = []
+    for s in [getattr(step, "step", None)] + (steps if isinstance(steps, list) else [steps]):
+        if s is not None:
+            res.extend(find_cached_steps(s))
+    return res
+
+
+def sum_stats(stats: Iterable[Dict]):
+    # CachedFitnessStep.stats() of several steps (e.g. one per worker process) added up, None if there are none
+    stats = list(stats)
+    if not stats:
+        return None
+    res = {name: sum(s[name] for s in stats) for name in ("hits", "misses", "size", "evaluated", "deduplicated")}
+    lookups = res["hits"] + res["misses"]
+    res["hit_rate"] = res["hits"] / lookups if lookups else 0.0
+    return res
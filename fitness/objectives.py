@@ -0,0 +1,22 @@
+from typing import List
+
+from evolalg.base.step import Step
+
+
+class ObjectivesStep(Step):
+    """Combines several evaluated fields (e.g. set by FitnessStep, one field per criterion) into multi-objective
+    fitness: a tuple of their values in the order of fields, or None when any of them is missing.
+
+    All objectives are maximized; negate a criterion in the expdef (or in a step before this one) to minimize it.
+    """
+
+    def __init__(self, fields: List[str], fit_attr="fitness", *args, **kwargs):
+        super(ObjectivesStep, self).__init__(*args, **kwargs)
+        self.fields = list(fields)
+        self.fit_attr = fit_attr
+
+    def call(self, population, *args, **kwargs):
+        for ind in population:
+            values = tuple(getattr(ind, field, None) for field in self.fields)
+            setattr(ind, self.fit_attr, None if any(v is None for v in values) else tuple(float(v) for v in values))
+        return population
@@ -0,0 +1,176 @@
+import json
+import math
+from statistics import NormalDist
+from typing import Callable, List
+
+import numpy as np
+
+from evolalg.base.individual import Individual
+from evolalg.base.step import Step
+from evolalg.utils.evaluator_pool import EvaluatorPool
+
+
+def t_quantile(p, df):
+    # quantile of Student's t distribution: exact for 1 and 2 degrees of freedom, otherwise the Cornish-Fisher
+    # expansion around the normal quantile (relative error below 0.2% for p = 0.975 from 3 degrees of freedom on,
+    # 1% for p = 0.995 at 3 and quickly less with more)
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    return (z
+            + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4))
+
+
+def _finite(values):
+    # a list for JSON, None where there is no value
+    return [v if math.isfinite(v) else None for v in values.tolist()]
+
+
+class HallOfFameReevaluation(Step):
+    """End step that evaluates every genotype of halloffame (e.g. StreamingStatistics.halloffame) several times,
+    as the result of a single noisy simulation may be a lucky one.
+
+    Genotypes are evaluated in rounds: min_evaluations times each in the first round, then batch_size more times
+    each while they are still active. All evaluations of a round are sent at once, in chunks, to an EvaluatorPool
+    (or to the evaluator step in this process). A genotype stops after max_evaluations, or earlier when the
+    confidence interval (at the confidence level) of its mean fitness is narrower than precision (absolute) or
+    relative_precision (relative to the mean), or, with rank_stability, when its interval no longer overlaps the
+    intervals of its neighbours in the ranking by mean fitness, so its place cannot change. Evaluations removed by
+    the evaluator (invalid) count as spent but give no sample.
+
+    Every member of halloffame gets the fields fitness_mean, fitness_variance (tuples for multi-objective fitness)
+    and evaluations; with sort, halloffame is reordered by fitness_mean (the first objective). The report lists
+    them and the evaluations saved compared with max_evaluations for every genotype. The pool is closed when done.
+    """
+
+    def __init__(self, halloffame: List, evaluator: Callable = None, pool: EvaluatorPool = None, max_evaluations=20,
+                 min_evaluations=3, batch_size=2, confidence=0.95, precision=None, relative_precision=None,
+                 rank_stability=False, chunk_size=4, sort=True, fit_attr="fitness", report_path=None,
+                 *args, **kwargs):
+        super(HallOfFameReevaluation, self).__init__(*args, **kwargs)
+        if evaluator is None and pool is None:
+            raise ValueError("HallOfFameReevaluation needs an evaluator step or an EvaluatorPool")
+        self.halloffame = halloffame
+        self.evaluator = evaluator
+        self.pool = pool
+        self.max_evaluations = max_evaluations
+        self.min_evaluations = min(max(2, min_evaluations), max_evaluations)  # a variance needs two samples
+        self.batch_size = batch_size
+        self.confidence = confidence
+        self.precision = precision
+        self.relative_precision = relative_precision
+        self.rank_stability = rank_stability
+        self.chunk_size = chunk_size
+        self.sort = sort
+        self.fit_attr = fit_attr
+        self.report_path = report_path
+        self.spent = {}  # genotype -> evaluations, including invalid ones
+        self.samples = {}  # genotype -> list of fitness values
+        self.objectives = 1
+
+    def init(self):
+        if isinstance(self.evaluator, Step):
+            self.evaluator.init()
+
+    def evaluate(self, requests):
+        # requests: genotype -> number of evaluations; every evaluation is a separate Individual
+        individuals = [Individual(genotype) for genotype, count in requests.items() for _ in range(count)]
+        chunks = [individuals[i:i + self.chunk_size] for i in range(0, len(individuals), self.chunk_size)]
+        if self.pool is not None:
+            results = [ind for future in [self.pool.submit(chunk) for chunk in chunks] for ind in future.result()]
+        else:
+            results = [ind for chunk in chunks for ind in self.evaluator(chunk)]
+        for genotype, count in requests.items():
+            self.spent[genotype] = self.spent.get(genotype, 0) + count
+        for ind in results:
+            value = getattr(ind, self.fit_attr, None)
+            if value is not None:
+                self.samples[ind.genotype].append(value)
+                self.objectives = len(value) if isinstance(value, tuple) else 1
+
+    def estimate(self, genotype):
+        # mean, sample variance and confidence interval half-width, one value per objective
+        values = np.array(self.samples[genotype], dtype=float).reshape(len(self.samples[genotype]), self.objectives)
+        if len(values) < 2:
+            nan = np.full(self.objectives, np.nan)
+            return (values[0] if len(values) else nan), nan, np.full(self.objectives, np.inf)
+        variance = values.var(axis=0, ddof=1)
+        half_width = t_quantile(0.5 + self.confidence / 2, len(values) - 1) * np.sqrt(variance / len(values))
+        return values.mean(axis=0), variance, half_width
+
+    def precise(self, mean, half_width):
+        if self.precision is not None and (half_width <= self.precision).all():
+            return True
+        return self.relative_precision is not None and (half_width <= self.relative_precision * np.abs(mean)).all()
+
+    def settled(self, genotypes, estimates):
+        # genotypes whose interval (of the first objective) is disjoint from those of their neighbours by mean
+        order = sorted(genotypes, key=lambda g: -estimates[g][0][0] if not np.isnan(estimates[g][0][0]) else math.inf)
+        low = [estimates[g][0][0] - estimates[g][2][0] for g in order]
+        high = [estimates[g][0][0] + estimates[g][2][0] for g in order]
+        res = set()
+        for i, genotype in enumerate(order):
+            if (i == 0 or low[i - 1] > high[i]) and (i == len(order) - 1 or low[i] > high[i + 1]):
+                res.add(genotype)
+        return res
+
+    def run(self, genotypes):
+        self.spent = {}
+        self.samples = {genotype: [] for genotype in genotypes}
+        active = {genotype: self.min_evaluations for genotype in genotypes}
+        while active:
+            self.evaluate(active)
+            estimates = {genotype: self.estimate(genotype) for genotype in genotypes}
+            settled = self.settled(genotypes, estimates) if self.rank_stability and len(genotypes) > 1 else set()
+            active = {genotype: min(self.batch_size, self.max_evaluations - self.spent[genotype])
+                      for genotype in active
+                      if self.spent[genotype] < self.max_evaluations and genotype not in settled
+                      and not self.precise(estimates[genotype][0], estimates[genotype][2])}
+        return {genotype: self.estimate(genotype) for genotype in genotypes}
+
+    def report(self, genotypes, estimates):
+        spent = sum(self.spent.values())
+        fixed = len(genotypes) * self.max_evaluations
+        lines = ["Hall of Fame re-evaluation: %d evaluations instead of %d (%d saved)" % (spent, fixed, fixed - spent)]
+        records = []
+        for genotype in genotypes:
+            mean, variance, half_width = estimates[genotype]
+            lines.append("%3d evaluations (%d valid)  mean %s  variance %s  +- %s  %s"
+                         % (self.spent[genotype], len(self.samples[genotype]), np.round(mean, 6).tolist(),
+                            np.round(variance, 6).tolist(), np.round(half_width, 6).tolist(), genotype.replace("\n", " ")))
+            records.append({"genotype": genotype, "samples": len(self.samples[genotype]),
+                            "evaluations": self.spent[genotype], "mean": _finite(mean),
+                            "variance": _finite(variance), "half_width": _finite(half_width)})
+        print("\n".join(lines))
+        if self.report_path is not None:
+            with open(self.report_path, "w") as file:
+                json.dump({"evaluations": spent, "fixed_evaluations": fixed, "saved": fixed - spent,
+                           "genotypes": records}, file, indent=1)
+
+    def call(self, population, *args, **kwargs):
+        genotypes = list(dict.fromkeys(ind.genotype for ind in self.halloffame))
+        if not genotypes:
+            return population
+        try:
+            estimates = self.run(genotypes)
+        finally:
+            if self.pool is not None:
+                self.pool.close()  # the run is over, the evaluators are not needed any more
+        for ind in self.halloffame:
+            mean, variance, _ = estimates[ind.genotype]
+            if isinstance(getattr(ind, self.fit_attr, None), tuple):
+                ind.fitness_mean, ind.fitness_variance = tuple(_finite(mean)), tuple(_finite(variance))
+            else:
+                ind.fitness_mean, ind.fitness_variance = _finite(mean)[0], _finite(variance)[0]
+            ind.evaluations = self.spent[ind.genotype]
+        if self.sort:
+            first = {genotype: estimates[genotype][0][0] for genotype in genotypes}
+            self.halloffame.sort(key=lambda ind: -math.inf if np.isnan(first[ind.genotype]) else first[ind.genotype],
+                                 reverse=True)
+        self.report(genotypes, estimates)
+        return population
@@ -1,21 +1,34 @@
-import copy
-import os
 import random
 from typing import List, Callable, Union
-from random import randrange
 
 import numpy as np
 
+from evolalg.base.array_population import ArrayPopulation, merge_populations
 from evolalg.base.step import Step
-import pickle
 import time
 
 from evolalg.base.union_step import UnionStep
+from evolalg.fitness.cached_fitness import find_cached_steps, sum_stats
 from evolalg.selection.selection import Selection
+from evolalg.statistics.streaming_statistics import StreamingStatistics, merge_moments
+from evolalg.utils.background import BackgroundWriter
+from evolalg.utils.budget_scheduler import BudgetScheduler
+from evolalg.utils.checkpoint import CHECKPOINT_VERSION, columns_to_population, load_state, population_to_columns, \
+    save_state
+from evolalg.utils.instrumentation import Instrumentation, instrument, instrument_generation
+from evolalg.utils.migration import Migration
+from evolalg.utils.population_log import MERGED, PopulationLog
+from evolalg.utils.splitting import split_population
 from evolalg.utils.stable_generation import StableGeneration
+from evolalg.utils.subpopulation_pool import SubpopulationPool, derive_seed, reseed
 import logging
 
 
+def _is_groups(population):
+    # a list of subpopulations rather than a list of individuals
+    return len(population) > 0 and all(isinstance(p, (list, ArrayPopulation)) for p in population)
+
+
 class MultiExperiment:
     def __init__(self, init_population: List[Callable],
                  selection: Selection,
@@ -27,14 +40,32 @@ class MultiExperiment:
                  when_merge,
                  subpop_num,
                  split_method,
-                 checkpoint_path=None, checkpoint_interval=None):
-
+                 checkpoint_path=None, checkpoint_interval=None,
+                 worker_setup: Callable = None,
+                 seed=None,
+                 instrumentation: Instrumentation = None,
+                 generation_step: Step = None,
+                 migration: Migration = None,
+                 statistics: StreamingStatistics = None,
+                 array_population=False,
+                 max_rounds=100, max_evaluations=None,
+                 scheduler: BudgetScheduler = None,
+                 population_log: PopulationLog = None):
+
+        if worker_setup is not None and generation_step is not None:
+            raise ValueError("generation_step cannot be used with worker_setup, the workers build their own "
+                             "StableGeneration")
         self.init_population = init_population
         self.running_time = 0
-        self.step = StableGeneration(
+        self.checkpoint_writer = BackgroundWriter()
+        # generation_step replaces the default StableGeneration, e.g. with a StreamingGeneration (serial mode only)
+        # max_rounds, max_evaluations: budget of one generation of a subpopulation, see StableGeneration
+        self.step_kwargs = {"max_rounds": max_rounds, "max_evaluations": max_evaluations}
+        self.step = generation_step if generation_step is not None else StableGeneration(
             selection=selection,
             steps=new_generation_steps,
-            population_size=population_size//subpop_num)
+            population_size=population_size//subpop_num,
+            **self.step_kwargs)
         self.generation_modification = UnionStep(generation_modification)
 
         self.end_steps = UnionStep(end_steps)
@@ -48,9 +79,39 @@ class MultiExperiment:
         self.when_merge = when_merge
         self.split_method = split_method
         self.subpop_num = subpop_num
-
-    def init(self):
-        self.generation = 0
+        # worker_setup: when given, every subpopulation is evolved in its own worker process (see SubpopulationPool)
+        self.worker_setup = worker_setup
+        # seed: when given, random and np.random are reseeded per generation and per subpopulation, so serial
+        # and parallel runs draw the same random numbers
+        self.seed = seed
+        # array_population: keep (sub)populations as ArrayPopulations (fitness in NumPy arrays) instead of lists
+        self.array_population = array_population
+        self.worker_counters = None
+        self.worker_cache_stats = None
+        self._merged_from = None  # the subpopulations self.population was merged from
+        self.presplit = False  # subpopulations were created by init_population and not split yet
+        # statistics: fitness statistics and hall of fame computed once per subpopulation, merged without rescanning
+        self.statistics = statistics
+        self.subpopulation_moments = []
+        # migration: island model, subpopulations exchange only emigrants instead of merging every when_merge generations
+        self.migration = migration
+        # scheduler: offspring per subpopulation by their progress, adaptive merging and early stopping;
+        # it works on the moments computed by statistics
+        if scheduler is not None and statistics is None:
+            raise ValueError("BudgetScheduler needs statistics (StreamingStatistics)")
+        self.scheduler = scheduler
+        if scheduler is not None and scheduler.max_merge_interval is None:
+            scheduler.max_merge_interval = when_merge
+        self.population_size = population_size
+        # population_log: genotypes and fitness of every generation, appended to a binary file in the background
+        self.population_log = population_log
+        # per-stage timings; a disabled Instrumentation costs (almost) nothing
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation(enabled=False)
+        if self.instrumentation.enabled:
+            instrument_generation(self.step, self.instrumentation)
+            instrument(self.generation_modification, self.instrumentation)
+
+    def init_steps(self):
         for s in self.init_population:
             if isinstance(s, Step):
                 s.init()
@@ -58,127 +119,257 @@ class MultiExperiment:
         self.step.init()
         self.generation_modification.init()
         self.end_steps.init()
+        if self.statistics is not None:
+            self.statistics.init()
+        if self.scheduler is not None:
+            self.scheduler.init()
+
+    def init(self):
+        self.generation = 0
+        self.reseed(0, 0)
+        self.init_steps()
+        self.subpopulations = None
+        self._merged_from = None
+        self.presplit = False
+        if self.population_log is not None:
+            self.population_log.truncate(0)  # a new run
         self.population = []
         for s in self.init_population:
+            if self.subpopulations is not None:
+                # after a step that created subpopulations (e.g. FramsSubpopulations) the next ones get each of them
+                self.subpopulations = [s(subp) for subp in self.subpopulations]
+                continue
             self.population = s(self.population)
+            if _is_groups(self.population):
+                self.subpopulations = self.population
+        if self.subpopulations is not None:
+            if self.array_population:
+                self.subpopulations = [ArrayPopulation.from_individuals(subp) for subp in self.subpopulations]
+            self.population = merge_populations(self.subpopulations)
+            self._merged_from = self.subpopulations
+            self.presplit = True
+        elif self.array_population:
+            self.population = ArrayPopulation.from_individuals(self.population)
 
     def sub_the_population(self, splitting_method, num_groups):
-        # equal number allocation
-        if splitting_method == "ena":
-            population = sorted(self.population, key=lambda x: getattr(x, "fitness"))
-            return np.array_split(population, num_groups)
-
-        # equal range allocation
-        if splitting_method == "era":
-            temp_population = copy.deepcopy(self.population)
-            res = []
-            number_of_elements = len(temp_population) // num_groups
-
-            for i in range(num_groups):
-                elems = [temp_population.pop(randrange(len(temp_population))) for _ in range(number_of_elements)]
-                res.append(elems)
+        # ena: equal number allocation, era: equal range allocation, ewa: equal width allocation,
+        # or any other method registered with register_split_method()
+        return split_population(self.population, splitting_method, num_groups)
+
+    def reseed(self, generation, stream):
+        if self.seed is not None:
+            reseed(derive_seed(self.seed, generation, stream))
+
+    def step_subpopulations(self, generation, pool=None, sizes=None):
+        # stream 0 is used by splitting, subpopulation k uses stream k + 1
+        # sizes: number of offspring of every subpopulation, None: the population_size of the step
+        if pool is not None:
+            seeds = [derive_seed(self.seed, generation, k + 1) if self.seed is not None else None
+                     for k in range(len(self.subpopulations))]
+            rejection_rates = getattr(self.step, "rejection_rates", None)
+            with self.instrumentation.measure("parallel_generation", self.population):
+                res = pool.map(self.subpopulations, seeds, sizes, rejection_rates)
+            if rejection_rates is not None:
+                rejection_rates.update(pool.rejection_rates)
             return res
+        res = []
+        for k, subp in enumerate(self.subpopulations):
+            self.reseed(generation, k + 1)
+            self.instrumentation.subpopulation = k
+            with self.instrumentation.measure("generation", subp) as result:
+                result[0] = self.step(subp, stream=k, population_size=sizes[k] if sizes is not None else None)
+            res.append(result[0])
+        self.instrumentation.subpopulation = None
+        return res
 
-        # equal width allocation
-        if splitting_method == "ewa":
-            best = max(self.population, key=lambda x: getattr(x, "fitness"))
-            worst = min(self.population, key=lambda x: getattr(x, "fitness"))
-
-            intervals = np.linspace(getattr(worst, "fitness"), getattr(best, "fitness"), num_groups + 1)
-            temp_population = copy.deepcopy(self.population)
-            res = []
-            elems = []
-
-            # It's worth to notice that the same result can be reached through popping individuals from
-            # temp_population after they are added to elems list. With current approach the complexity is O(n^2).
-
-            # [0 ; x] (x ; 2x] ... ((n-1)x ; nx] - the pattern of dividing fitness into intervals.
-            # The first interval is closed from right and left to ensure that the first subpopulation
-            # will never be empty. Each subsequent interval is closed from left to ensure that
-            # the last interval never will lose the best solution.
-            for individual in temp_population:
-                if intervals[0] <= getattr(individual, "fitness") <= intervals[1]:
-                    elems.append(individual)
-            res.append(elems)
-
-            for i in range(1, len(intervals[:-1])):
-                elems = []
-                for individual in temp_population:
-                    if intervals[i] < getattr(individual, "fitness") <= intervals[i + 1]:
-                        elems.append(individual)
-                if len(elems) == 0:
-                    elems = res[i - 1]
-                res.append(elems)
-
-            return res
+    def modify_subpopulations(self, phase):
+        self.subpopulation_moments = []
+        for k, subp in enumerate(self.subpopulations):
+            self.instrumentation.subpopulation = k
+            with self.instrumentation.measure("statistics", subp):
+                if self.statistics is not None:
+                    self.subpopulation_moments.append(self.statistics.observe(subp, self.generation, k, phase))
+                self.generation_modification(subp)
+            if self.population_log is not None:
+                with self.instrumentation.measure("population_log", subp):
+                    self.population_log.log(subp, self.generation, k, phase)
+        self.instrumentation.subpopulation = None
 
     def run(self, num_generations):
-        flag = 1
+        pool = None
+        if self.worker_setup is not None:
+            pool = SubpopulationPool(self.worker_setup, self.step.population_size, self.subpop_num, self.instrumentation,
+                                     self.step_kwargs)
+            pool.start()
+        try:
+            self.run_generations(num_generations, pool)
+        finally:
+            if pool is not None:
+                self.worker_counters = pool.counters()
+                self.worker_cache_stats = pool.evaluation_cache_stats()
+                pool.close()
+            if hasattr(self.step, "close"):
+                self.step.close()
+            self.checkpoint_writer.flush()
+            if self.population_log is not None:
+                self.population_log.flush()
+
+        self.population = self.end_steps(self.population)
 
+    def generation_counters(self):
+        # offspring evaluated, accepted, rejected and wasted by the generation step (summed over workers if parallel)
+        if self.worker_counters is not None:
+            return dict(self.worker_counters)
+        return dict(getattr(self.step, "counters", {}))
+
+    def evaluation_cache_stats(self):
+        # statistics of the evaluation caches of the generation step, in this process and in the workers if parallel;
+        # caches of the evaluator processes of a StreamingGeneration are not included
+        stats = [s.stats() for s in find_cached_steps(self.step)]
+        if self.worker_cache_stats is not None:
+            stats.append(self.worker_cache_stats)
+        return sum_stats(stats)
+
+    def run_generations(self, num_generations, pool=None):
         for i in range(self.generation + 1, num_generations + 1):
             print("GENERATION N.", i)
             start_time = time.time()
             self.generation = i
-
-            # periodic splitting
-            if flag != 1 and (i % self.when_merge) - 1 == 0:
-                self.subpopulations = self.sub_the_population(self.split_method, self.subpop_num)
-
-            # initial splitting (executed once)
-            if flag == 1:
-                self.subpopulations = self.sub_the_population(self.split_method, self.subpop_num)
-                flag = 0
+            self.instrumentation.generation = i
+
+            self.reseed(i, 0)
+
+            # initial splitting (executed once, skipped when subpopulations were restored from a checkpoint)
+            # and periodic splitting (not in the island model)
+            if self.scheduler is not None:
+                split = self.scheduler.should_split(i)
+            else:
+                split = (i % self.when_merge) - 1 == 0
+            split = self.subpopulations is None or (self.migration is None and split)
+            if self.presplit:
+                # the first subpopulations came from init_population and are used as they are
+                split, self.presplit = False, False
+                if self.scheduler is not None:
+                    self.scheduler.split(i, len(self.subpopulations))
+            if split:
+                with self.instrumentation.measure("splitting", self.population):
+                    self.subpopulations = self.sub_the_population(self.split_method, self.subpop_num)
+                if self.scheduler is not None:
+                    self.scheduler.split(i, len(self.subpopulations))
 
             # statistics for each subpopulation
             print("BEFORE")
-            for subp in self.subpopulations:
-                self.generation_modification(subp)
+            self.modify_subpopulations("before")
 
             # operations on each subpopulation
-            self.subpopulations = [self.step(subp) for subp in self.subpopulations]
+            sizes = None
+            if self.scheduler is not None:
+                sizes = self.scheduler.budgets(self.population_size // self.subpop_num * len(self.subpopulations))
+                print("OFFSPRING PER SUBPOPULATION", sizes)
+            self.subpopulations = self.step_subpopulations(i, pool, sizes)
 
             print("AFTER")
             # statistics for each subpopulation
-            for subp in self.subpopulations:
-                self.generation_modification(subp)
+            self.modify_subpopulations("after")
 
-            # merging subpopulations
+            converged = False
+            if self.scheduler is not None:
+                self.scheduler.observe(self.subpopulation_moments, i)
+                converged = self.scheduler.converged(i)
+
+            if self.migration is not None and self.migration.is_migration_generation(i) and i != num_generations:
+                with self.instrumentation.measure("migration", self.subpopulations):
+                    self.subpopulations = self.migration.migrate(self.subpopulations, i)
+
+            # merging subpopulations (in the island model only at the end)
             # statistics for merged population
-            if i % self.when_merge == 0 or i == num_generations:
-                self.population = [ind for subp in self.subpopulations for ind in subp]
+            if self.scheduler is not None:
+                merge = self.migration is None and self.scheduler.should_merge(i)
+            else:
+                merge = self.migration is None and i % self.when_merge == 0
+            if merge or converged or i == num_generations:
+                if self.scheduler is not None:
+                    self.scheduler.merged(i)
+                with self.instrumentation.measure("merging") as result:
+                    self.population = result[0] = merged = merge_populations(self.subpopulations)
                 print("STATISTICS FOR MERGED POPULATION")
-                self.population = self.generation_modification(self.population)
+                with self.instrumentation.measure("statistics", self.population):
+                    if self.statistics is not None:
+                        self.statistics.log(merge_moments(self.subpopulation_moments), i, None, "merged")
+                    self.population = self.generation_modification(self.population)
+                if self.population_log is not None:
+                    with self.instrumentation.measure("population_log", self.population):
+                        self.population_log.log(self.population, i, MERGED, "merged")
+                # checkpoints do not store the population again while it is still the merged subpopulations
+                self._merged_from = self.subpopulations if self.population is merged else None
 
             self.running_time += time.time() - start_time
             if (self.checkpoint_path is not None
                     and self.checkpoint_interval is not None
-                    and i % self.checkpoint_interval == 0):
-                self.save_checkpoint()
-
-        self.population = self.end_steps(self.population)
+                    and (i % self.checkpoint_interval == 0 or converged)):
+                with self.instrumentation.measure("checkpoint", self.population):
+                    self.save_checkpoint()
+            self.instrumentation.end_generation()
+            if converged:
+                print("CONVERGED IN GENERATION", i)
+                break
+
+    def stateful_steps(self):
+        # steps (e.g. statistics) that keep their own state in checkpoints, found by walking nested UnionSteps
+        res = []
+        pending = [self.generation_modification, self.end_steps]
+        while pending:
+            step = pending.pop(0)
+            if hasattr(step, "checkpoint_state") and hasattr(step, "restore_checkpoint_state"):
+                res.append(step)
+            pending[:0] = list(getattr(step, "steps", []))
+        return res
 
-        # self.check_checkpoint()
+    def checkpoint_state(self):
+        population_is_merged = self.subpopulations is not None and self._merged_from is self.subpopulations
+        return {
+            "version": CHECKPOINT_VERSION,
+            "generation": self.generation,
+            "running_time": self.running_time,
+            "subpopulations": None if self.subpopulations is None
+            else [population_to_columns(subp) for subp in self.subpopulations],
+            "population": None if population_is_merged else population_to_columns(self.population),
+            "random_state": random.getstate(),
+            "numpy_random_state": np.random.get_state(),
+            "statistics": [step.checkpoint_state() for step in self.stateful_steps()],
+            "halloffame": self.statistics.checkpoint_state() if self.statistics is not None else None,
+            "scheduler": self.scheduler.checkpoint_state() if self.scheduler is not None else None,
+            "generation_step": self.step.checkpoint_state() if hasattr(self.step, "checkpoint_state") else None,
+        }
 
     def save_checkpoint(self):
-        tmp_filepath = self.checkpoint_path + "+pop_size=" + str(len(self.population)) + "+subpop_num=" + str(self.subpop_num) + "+when_merge=" + str(self.when_merge)
-        try:
-            with open(tmp_filepath, "wb") as file:
-                pickle.dump(self, file)
-            os.replace(tmp_filepath,
-                       tmp_filepath)  # ensures the new file was first saved OK (e.g. enough free space on device), then replace
-        except Exception as ex:
-            raise RuntimeError(
-                "Failed to save checkpoint '%s' (because: %s). This does not prevent the experiment from continuing, but let's stop here to fix the problem with saving checkpoints." % (
-                tmp_filepath, ex))
-
-    # def check_checkpoint(self):
-    #    with open('C:\\framsticks\\library\\framspy\\checkpoints', 'rb') as f:
-    #        data = pickle.load(f)
-    #        with open('foo.txt', 'w') as r:
-    #
-    #        print(data)
-    @staticmethod
-    def restore(path):
-        with open(path) as file:
-            res = pickle.load(file)
-        return res
+        # the state is copied into arrays here, pickling and writing happen in the background
+        self.checkpoint_writer.submit(save_state, self.checkpoint_path, self.checkpoint_state())
+
+    def load_checkpoint(self, path):
+        # restores the evolving state into this (already configured) experiment; use instead of init()
+        state = load_state(path)
+        self.init_steps()
+        self.generation = state["generation"]
+        self.running_time = state["running_time"]
+        self.subpopulations = None if state["subpopulations"] is None \
+            else [columns_to_population(columns, array_population=self.array_population)
+                  for columns in state["subpopulations"]]
+        if state["population"] is None:
+            self.population = merge_populations(self.subpopulations)
+            self._merged_from = self.subpopulations
+        else:
+            self.population = columns_to_population(state["population"], array_population=self.array_population)
+            self._merged_from = None
+        random.setstate(state["random_state"])
+        np.random.set_state(state["numpy_random_state"])
+        for step, step_state in zip(self.stateful_steps(), state["statistics"]):
+            step.restore_checkpoint_state(step_state)
+        if self.statistics is not None and state["halloffame"] is not None:
+            self.statistics.restore_checkpoint_state(state["halloffame"])
+        if self.population_log is not None:
+            self.population_log.truncate(self.generation)  # generations after the checkpoint will be logged again
+        if self.scheduler is not None and state.get("scheduler") is not None:
+            self.scheduler.restore_checkpoint_state(state["scheduler"])
+        if hasattr(self.step, "restore_checkpoint_state") and state.get("generation_step") is not None:
+            self.step.restore_checkpoint_state(state["generation_step"])
@@ -1,32 +1,120 @@
+import itertools
+from typing import Dict, Iterator
+
 from evolalg.base.frams_step import FramsStep
 from evolalg.base.individual import Individual
-import numpy as np
+from evolalg.base.step import Step
+from evolalg.utils.clone import clone_individual
+from evolalg.utils.splitting import split_population
+
+
+def read_gen_file(path) -> Iterator[Dict[str, str]]:
+    # Streams the objects of a Framsticks .gen file (e.g. halloffame.gen written by PopulationSave) one by one,
+    # as dictionaries of field values. An object starts with its class name ("org:") and ends with an empty line;
+    # multi-line values are written as "field:~" ... "~".
+    record = None
+    with open(path, encoding="utf-8") as file:
+        lines = iter(file)
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                if record:
+                    yield record
+                record = None
+            elif record is None:
+                if line.endswith(":") and not line.startswith("#"):
+                    record = {}
+            elif ":" in line:
+                key, value = line.split(":", 1)
+                if value.startswith("~"):
+                    value = value[1:]
+                    if not value:  # the value starts on the next line
+                        value = next(lines, "~").rstrip("\r\n")
+                    parts = []
+                    while not (value.endswith("~") and not value.endswith("\\~")):
+                        parts.append(value)
+                        value = next(lines, "~").rstrip("\r\n")
+                    parts.append(value[:-1])
+                    value = "\n".join(parts).replace("\\~", "~")
+                record[key] = value
+    if record:
+        yield record
+
+
+def read_genotypes(path) -> Iterator[str]:
+    for record in read_gen_file(path):
+        if "genotype" in record:
+            yield record["genotype"]
+
 
 class FramsSubpopulations(FramsStep):
-    def __init__(self, frams_lib, genetic_format, pop_size, commands=None, how_many_subp, *args, **kwargs):
-        
-        #jak działa commands? czy są to parametry wpisywane z konsoli? zapytać.
+    """Creates how_many_subp subpopulations of pop_size individuals each and returns them as a list of lists.
+
+    The individuals are copies of seed genotypes: the simplest genotype of genetic_format, or the genotypes read
+    (lazily, only as many as needed) from seed_path, e.g. the halloffame.gen of a previous run, repeated in turn
+    when there are fewer of them than individuals. Each distinct seed is created and evaluated (by the evaluation
+    step, e.g. FitnessStep followed by FieldRemove) once, and the result is shared by its copies, so identical
+    individuals are not simulated again. Evaluated individuals are divided into subpopulations by
+    splitting_method (see utils/splitting.py); copies of a single seed and individuals without fitness are dealt out
+    in turn.
+    """
+
+    def __init__(self, frams_lib, genetic_format, pop_size, how_many_subp, commands=None, seed_path=None,
+                 evaluation: Step = None, splitting_method="ena", fit_attr="fitness", evaluation_attempts=3,
+                 *args, **kwargs):
         if commands is None:
             commands = []
-        super().__init__(frams_lib, commands,*args, **kwargs)
-        
-        self.pop_size = pop_size #czy może self.pop_size = pop_size // how_many_subp ? ustalić czym tak naprawdę ma tu być pop_size: liczbą osobników w ogóle czy w podpopulacji
+        super().__init__(frams_lib, commands, *args, **kwargs)
+        self.pop_size = pop_size  # individuals in one subpopulation
         self.genetic_format = genetic_format
-        
-        #czy mogę tak przyjmować how_many_subp w __init__ ? czy muszę dodać ten parametr w innej klasie?
         self.how_many_subp = how_many_subp
+        self.seed_path = seed_path
+        self.evaluation = evaluation
+        self.splitting_method = splitting_method
+        self.fit_attr = fit_attr
+        self.evaluation_attempts = evaluation_attempts
 
-    def call(self, population, *args, **kwargs):
-        super(FramsPopulation, self).call(population) #jak to działa?
-        
-        population = [Individual(self.frams.getSimplest(self.genetic_format)) for _ in range(self.pop_size * self.how_many_subp)]
-        population = sorted(population, key=lambda x: getattr(x, self.fit_attr)) #sortuję według fitnessu
-        res = np.array_split(population, self.how_many_subp)
-        return res
-        
-        #jeżeli populacje należy splitować w innej klasie użyć kodu poniżej. PRZEDYSKUTOWAĆ!!!
-        #return [[Individual(self.frams.getSimplest(self.genetic_format)) for _ in range(self.pop_size)] for _ in range(self.how_many_subp)]
-
-#alternatywnie: czy można zwracać listę obiektów FramsPopulation zamiast listy list osobników?
-#raczej nie, ale przedyskutować
+    def init(self):
+        if isinstance(self.evaluation, Step):
+            self.evaluation.init()
 
+    def seeds(self, count):
+        if self.seed_path is None:
+            return [Individual(self.frams.getSimplest(self.genetic_format))]
+        seeds = {}
+        for record in itertools.islice(read_gen_file(self.seed_path), count):
+            if "genotype" not in record or record["genotype"] in seeds:
+                continue
+            ind = Individual(record["genotype"])
+            if self.evaluation is None and self.fit_attr in record:
+                try:
+                    setattr(ind, self.fit_attr, float(record[self.fit_attr]))
+                except ValueError:
+                    pass
+            seeds[ind.genotype] = ind
+        return list(seeds.values())
+
+    def evaluate(self, seeds):
+        # the evaluation may remove invalid seeds; as a failed simulation is not always the fault of the genotype,
+        # removed seeds get evaluation_attempts chances in total
+        valid = {}
+        for _ in range(self.evaluation_attempts):
+            for ind in self.evaluation([clone_individual(ind) for ind in seeds if ind.genotype not in valid]):
+                valid[ind.genotype] = ind
+            if len(valid) == len(seeds):
+                break
+        return [valid[ind.genotype] for ind in seeds if ind.genotype in valid]
+
+    def call(self, population, *args, **kwargs):
+        super(FramsSubpopulations, self).call(population)
+        count = self.pop_size * self.how_many_subp
+        seeds = self.seeds(count)
+        if self.evaluation is not None:
+            seeds = self.evaluate(seeds)
+        if not seeds:
+            raise ValueError("No valid seed genotype for FramsSubpopulations")
+        population = [clone_individual(seeds[i % len(seeds)]) for i in range(count)]
+        if len(seeds) > 1 and all(getattr(ind, self.fit_attr, None) is not None for ind in seeds):
+            return split_population(population, self.splitting_method, self.how_many_subp, self.fit_attr)
+        # copies of a single seed (or individuals without fitness) have nothing to be split by
+        return [population[k::self.how_many_subp] for k in range(self.how_many_subp)]
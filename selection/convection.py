@@ -1,12 +1,12 @@
 from evolalg.base.individual import Individual
 from typing import List
-import random
-import math
 import numpy as np
-from random import randrange
 
 from evolalg.base.step import Step
 from evolalg.selection.selection import Selection
+from evolalg.utils.clone import clone_individual
+from evolalg.utils.pareto import ParetoFrontsPool, objective_values, pareto_scores
+from evolalg.utils.splitting import split_population
 
 class ConvectionSelection(Selection):
     def __init__(self, tournament_size: int, number_of_divisions : int, fit_attr="fitness", copy=False, *args, **kwargs):
@@ -14,51 +14,52 @@ class ConvectionSelection(Selection):
         self.tournament_size = tournament_size
         self.number_of_divisions = number_of_divisions
         self.fit_attr = fit_attr
-    
+        # fitness array and its sorted strata from the last stratify(); reused until the population changes
+        self._fitness = None
+        self._strata = None
+        self._fronts = ParetoFrontsPool()  # multi-objective fitness is sorted by front and crowding distance
+
+    def init(self):
+        self._fitness = None
+        self._strata = None
+        self._fronts.init()
+
+    def stratify(self, population):
+        fitness = objective_values(population, self.fit_attr)
+        if self._strata is None or not np.array_equal(fitness, self._fitness, equal_nan=True):
+            key = pareto_scores(fitness, self._fronts) if fitness.ndim == 2 else fitness
+            order = np.argsort(key, kind="stable")  # sorting by fitness
+            # the same divisions as np.array_split(sorted population, number_of_divisions), empty ones skipped
+            base, extra = divmod(len(order), self.number_of_divisions)
+            sizes = np.array([base + 1] * extra + [base] * (self.number_of_divisions - extra), dtype=np.intp)
+            sizes = sizes[sizes > 0]
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.intp)
+            self._fitness = fitness
+            self._strata = (order, starts, sizes)
+        return self._strata
+
+    def select_indices(self, population, selection_size):
+        order, starts, sizes = self.stratify(population)
+        # one tournament of tournament_size per division for each of the selection_size picks, all drawn at once
+        draws = np.random.random((selection_size, len(sizes), self.tournament_size))
+        positions = starts[None, :, None] + (draws * sizes[None, :, None]).astype(np.intp)
+        # positions index the population sorted by fitness, so the best of every tournament and then the best
+        # of all divisions is simply the largest position
+        return order[positions.max(axis=(1, 2))]
+
     def select_next(self, population):
-        def sub_the_population(population):
-            population = sorted(population, key=lambda x: getattr(x, self.fit_attr)) #sortuję według fitnessu
-            res = np.array_split(population,self.number_of_divisions)
-            return res
-            
-        subpopulations = sub_the_population(population)
-        res = []
-        for subp in subpopulations:
-            selected = [random.choice(subp) for i in range(self.tournament_size)]
-            res.append(max(selected, key=lambda x: getattr(x, self.fit_attr)))
-        
-        return max(res, key=lambda x: getattr(x, self.fit_attr))
+        return population[self.select_indices(population, 1)[0]]
+
+    def call(self, population, selection_size=None):
+        if selection_size is None:
+            selection_size = len(population)
+        res = [population[i] for i in self.select_indices(population, selection_size)]
+        if self.copy:
+            res = [clone_individual(x) for x in res]
+        return res
 
     def randomAllocation(self, population, num_groups):
-        ret = []
-        temp_population = copy.deepcopy(population)
-        for i in range(len(num_groups)):
-            number_of_elements = len(temp_population) // (num_groups - i)
-            elems = [temp_population.pop(randrange(len(temp_population))) for _ in range(number_of_elements)] #czy zabezpieczone przed indeksem -1 ? tak
-            ret.append(elems)
-        return ret
-        
-    def equalWidthAllocation(self, population, num_groups):
-        best = max(population, key=lambda x: getattr(x, self.fit_attr)) 
-        worst = min(population, key=lambda x: getattr(x, self.fit_attr))
-        ret = []
-        for i in range(num_groups):
-            elems = []
-            mini = getattr(worst, self.fit_attr) + (getattr(best, self.fit_attr) - getattr(worst, self.fit_attr)) * g / num_groups
-            maxi = getattr(worst, self.fit_attr) + (getattr(best, self.fit_attr) - getattr(worst, self.fit_attr)) * (g+1) / num_groups
-            
-            for j in range(len(population)):
-                if getattr(population[j], self.fit_attr) >= mini and getattr(population[j], self.fit_attr) <= maxi:
-                    elems.append(population[j])
-            if len(elems) == 0:
-                if i == 0:
-                    elems.append(population.index(worst))
-                else:
-                    elems = ret[len(ret) - 1]
-            ret.append(elems)
-            
-                
-            
-            
-        
+        return split_population(population, "era", num_groups, self.fit_attr)
 
+    def equalWidthAllocation(self, population, num_groups):
+        return split_population(population, "ewa", num_groups, self.fit_attr)
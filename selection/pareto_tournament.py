@@ -0,0 +1,39 @@
+import numpy as np
+
+from evolalg.selection.selection import Selection
+from evolalg.utils.clone import clone_individual
+from evolalg.utils.pareto import ParetoFrontsPool, objective_values, pareto_scores
+
+
+class ParetoTournamentSelection(Selection):
+    """Tournament selection for multi-objective fitness (tuples of criteria, all maximized).
+
+    The winner of a tournament is the individual from the best front, and among those from one front the one with
+    the largest crowding distance (the crowded-comparison operator of NSGA-II). Fronts are kept by a ParetoFrontsPool
+    (updated incrementally, one ParetoFronts per subpopulation), and all tournaments of one call are drawn at once.
+    Scalar fitness gives an ordinary tournament.
+    """
+
+    def __init__(self, tournament_size: int, fit_attr="fitness", copy=False, *args, **kwargs):
+        super(ParetoTournamentSelection, self).__init__(copy, *args, **kwargs)
+        self.tournament_size = tournament_size
+        self.fit_attr = fit_attr
+        self._fronts = ParetoFrontsPool()
+
+    def init(self):
+        self._fronts.init()
+
+    def select_indices(self, population, selection_size):
+        fitness = objective_values(population, self.fit_attr)
+        key = pareto_scores(fitness, self._fronts) if fitness.ndim == 2 else np.where(np.isnan(fitness), -np.inf, fitness)
+        contestants = np.random.randint(len(population), size=(selection_size, self.tournament_size))
+        winners = key[contestants].argmax(axis=1)
+        return contestants[np.arange(selection_size), winners]
+
+    def call(self, population, selection_size=None):
+        if selection_size is None:
+            selection_size = len(population)
+        res = [population[i] for i in self.select_indices(population, selection_size)]
+        if self.copy:
+            res = [clone_individual(x) for x in res]
+        return res
@@ -0,0 +1,207 @@
+import heapq
+import itertools
+import json
+import logging
+import math
+
+import numpy as np
+
+from evolalg.base.array_population import IndividualView
+from evolalg.base.individual import Individual
+from evolalg.base.step import Step
+from evolalg.utils.pareto import crowding_distance, non_dominated_ranks, objective_values
+
+logger = logging.getLogger(__name__)
+
+
+class FitnessMoments:
+    """count, mean, sum of squared deviations (m2), min and max of fitness values.
+
+    Moments of disjoint groups merge exactly (Chan et al.), so statistics of a merged population
+    can be computed from the statistics of its subpopulations without looking at the individuals again.
+    For multi-objective fitness, mean, m2, min and max are arrays with one value per objective.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min=math.inf, max=-math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    @classmethod
+    def from_array(cls, values):
+        if values.ndim == 2:
+            values = values[~np.isnan(values).any(axis=1)]
+            if len(values) == 0:
+                return cls()
+            mean = values.mean(axis=0)
+            return cls(len(values), mean, ((values - mean) ** 2).sum(axis=0), values.min(axis=0), values.max(axis=0))
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls()
+        mean = float(values.mean())
+        return cls(len(values), mean, float(((values - mean) ** 2).sum()), float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        if other.count == 0:
+            return FitnessMoments(self.count, self.mean, self.m2, self.min, self.max)
+        if self.count == 0:
+            return FitnessMoments(other.count, other.mean, other.m2, other.min, other.max)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        return FitnessMoments(count,
+                              self.mean + delta * other.count / count,
+                              self.m2 + other.m2 + delta * delta * self.count * other.count / count,
+                              np.minimum(self.min, other.min) if np.ndim(self.min) else min(self.min, other.min),
+                              np.maximum(self.max, other.max) if np.ndim(self.max) else max(self.max, other.max))
+
+    @property
+    def std(self):
+        # population standard deviation, the same as np.std
+        if np.ndim(self.m2):
+            return np.sqrt(self.m2 / self.count)
+        return math.sqrt(self.m2 / self.count) if self.count else math.nan
+
+    def as_dict(self):
+        if self.count == 0:
+            return {"count": 0, "avg": None, "stddev": None, "min": None, "max": None}
+        values = {"avg": self.mean, "stddev": self.std, "min": self.min, "max": self.max}
+        res = {"count": self.count}
+        res.update((key, value.tolist() if isinstance(value, np.ndarray) else value) for key, value in values.items())
+        return res
+
+
+def merge_moments(moments):
+    res = FitnessMoments()
+    for m in moments:
+        res = res.merge(m)
+    return res
+
+
+class StreamingStatistics(Step):
+    """Fitness statistics and hall of fame that look at every individual once.
+
+    The fitness of a population is extracted into one array; its moments are logged as JSON (to the logger
+    of this module and, if given, appended to log_path as JSONL). Moments of a subpopulation are remembered,
+    so observing the same, unchanged subpopulation again costs nothing, and merged statistics come from
+    merge_moments(). The hall of fame is a bounded min-heap of the hof_size best distinct genotypes;
+    halloffame is the best-first list, updated in place so it can be given to PopulationSave as provider.
+    With multi-objective fitness (tuples), moments are per objective and the hall of fame is an archive of
+    non-dominated distinct genotypes, reduced to the hof_size least crowded ones when there are more.
+    """
+
+    def __init__(self, hof_size=10, fit_attr="fitness", log_path=None, *args, **kwargs):
+        super(StreamingStatistics, self).__init__(*args, **kwargs)
+        self.hof_size = hof_size
+        self.fit_attr = fit_attr
+        self.log_path = log_path
+        self.halloffame = []
+        self._heap = []  # (fitness, counter, individual), the worst member of the hall of fame first
+        self._counter = itertools.count()
+        self._hof_genotypes = set()
+        self._seen = {}  # subpopulation -> (population object, its FitnessMoments)
+
+    def init(self):
+        self.halloffame.clear()
+        self._heap = []
+        self._hof_genotypes = set()
+        self._seen = {}
+
+    def update_halloffame(self, population, fitness):
+        full = len(self._heap) >= self.hof_size
+        threshold = self._heap[0][0] if full else -math.inf
+        candidates = np.nonzero(fitness > threshold)[0]  # NaN (no fitness) never passes
+        if len(candidates) == 0:
+            return
+        for i in candidates[np.argsort(fitness[candidates], kind="stable")[::-1]].tolist():
+            ind = population[i]
+            if ind.genotype in self._hof_genotypes:
+                continue
+            if isinstance(ind, IndividualView):
+                ind = ind.clone()  # do not keep whole populations alive through their rows
+            entry = (float(fitness[i]), next(self._counter), ind)
+            if len(self._heap) < self.hof_size:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                removed = heapq.heapreplace(self._heap, entry)
+                self._hof_genotypes.discard(removed[2].genotype)
+            else:
+                break  # candidates are sorted, the rest are not better either
+            self._hof_genotypes.add(ind.genotype)
+        self.halloffame[:] = [entry[2] for entry in sorted(self._heap, reverse=True)]
+
+    def update_pareto_archive(self, population, objectives):
+        # only the first front of the population can enter the archive
+        valid = np.nonzero(~np.isnan(objectives).any(axis=1))[0]
+        if len(valid) == 0:
+            return
+        candidates = valid[non_dominated_ranks(objectives[valid]) == 0]
+        new = []
+        for i in candidates.tolist():
+            ind = population[i]
+            if ind.genotype in self._hof_genotypes:
+                continue
+            self._hof_genotypes.add(ind.genotype)
+            new.append(ind.clone() if isinstance(ind, IndividualView) else ind)
+        if not new:
+            return
+        archive = self.halloffame + new
+        values = np.array([getattr(ind, self.fit_attr) for ind in archive], dtype=float)
+        keep = np.nonzero(non_dominated_ranks(values) == 0)[0]
+        if len(keep) > self.hof_size:
+            crowding = crowding_distance(values[keep], np.zeros(len(keep), dtype=np.intp))
+            keep = keep[np.argsort(-crowding, kind="stable")[:self.hof_size]]
+        keep = keep[np.lexsort(-values[keep].T[::-1])]  # best in the first objective first
+        self.halloffame[:] = [archive[i] for i in keep.tolist()]
+        self._hof_genotypes = {ind.genotype for ind in self.halloffame}
+
+    def observe(self, population, generation=None, subpopulation=None, phase=None):
+        seen = self._seen.get(subpopulation) if subpopulation is not None else None
+        if seen is not None and seen[0] is population:
+            moments = seen[1]
+        else:
+            fitness = objective_values(population, self.fit_attr) if len(population) else np.zeros(0)
+            moments = FitnessMoments.from_array(fitness)
+            if fitness.ndim == 2:
+                self.update_pareto_archive(population, fitness)
+            else:
+                self.update_halloffame(population, fitness)
+            if subpopulation is not None:
+                self._seen[subpopulation] = (population, moments)
+        self.log(moments, generation, subpopulation, phase)
+        return moments
+
+    def log(self, moments, generation=None, subpopulation=None, phase=None):
+        record = {"generation": generation, "subpopulation": subpopulation, "phase": phase}
+        record.update(moments.as_dict())
+        line = json.dumps(record)
+        logger.info(line)
+        if self.log_path is not None:
+            with open(self.log_path, "a") as file:
+                file.write(line + "\n")
+        return record
+
+    def call(self, population, *args, **kwargs):
+        self.observe(population)
+        return population
+
+    def checkpoint_state(self):
+        if not self._heap:  # empty, or the multi-objective archive
+            return [(ind.genotype, getattr(ind, self.fit_attr)) for ind in self.halloffame]
+        return [(entry[2].genotype, entry[0]) for entry in self._heap]
+
+    def restore_checkpoint_state(self, state):
+        self.init()
+        for genotype, fitness in state:
+            ind = Individual(genotype)
+            setattr(ind, self.fit_attr, fitness)
+            if isinstance(fitness, tuple):
+                self.halloffame.append(ind)
+            else:
+                heapq.heappush(self._heap, (fitness, next(self._counter), ind))
+            self._hof_genotypes.add(genotype)
+        if self._heap:
+            self.halloffame[:] = [entry[2] for entry in sorted(self._heap, reverse=True)]
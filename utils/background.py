@@ -0,0 +1,62 @@
+import queue
+import threading
+
+
+class BackgroundWriter:
+    """Runs write jobs one after another in a daemon thread, so that the main loop does not wait for the disk.
+
+    At most max_pending jobs wait in the queue; submitting more blocks until the writer catches up. An exception
+    raised by a job is re-raised as RuntimeError by the next submit() or flush().
+    """
+
+    def __init__(self, max_pending=2):
+        self.max_pending = max_pending
+        self._queue = None
+        self._thread = None
+        self._error = None
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                function, args = job
+                try:
+                    function(*args)
+                except Exception as ex:
+                    self._error = ex
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Background write failed (because: %s)" % error) from error
+
+    def submit(self, function, *args):
+        self._raise_error()
+        if self._thread is None:
+            self._queue = queue.Queue(self.max_pending)
+            self._thread = threading.Thread(target=self._run, name="BackgroundWriter", daemon=True)
+            self._thread.start()
+        self._queue.put((function, args))
+
+    def flush(self):
+        if self._thread is not None:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
+        self._raise_error()
+
+    def __getstate__(self):
+        return {"max_pending": self.max_pending}  # the thread and its queue are not copied
+
+    def __setstate__(self, state):
+        self.__init__(**state)
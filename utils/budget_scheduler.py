@@ -0,0 +1,125 @@
+import math
+from collections import deque
+from typing import List
+
+import numpy as np
+
+from evolalg.statistics.streaming_statistics import FitnessMoments
+
+
+class BudgetScheduler:
+    """Distributes the offspring (and so the evaluations) of a generation among subpopulations by their progress,
+    decides when subpopulations are merged, and when the whole run has converged.
+
+    It is fed with the per-subpopulation FitnessMoments computed by StreamingStatistics after every generation.
+    The score of a subpopulation is the improvement of its best fitness per generation over the last window
+    generations plus diversity_weight times its fitness standard deviation, both relative to the average
+    standard deviation of all subpopulations. A min_share fraction of the offspring is always divided equally,
+    the rest in proportion to the scores; no subpopulation gets less than min_size offspring.
+
+    Subpopulations are merged when all of them stagnated (the best fitness did not improve by more than tolerance)
+    for stagnation generations, but not before min_merge_interval and at the latest after max_merge_interval
+    generations since the split. The run converged when the best fitness found did not improve for patience
+    generations, or (if min_std is given) when the standard deviation of fitness fell below min_std everywhere.
+    """
+
+    def __init__(self, min_share=0.5, min_size=2, window=5, diversity_weight=0.5, stagnation=5,
+                 min_merge_interval=1, max_merge_interval=None, patience=None, min_std=None, tolerance=1e-12):
+        self.min_share = min_share
+        self.min_size = min_size
+        self.window = window
+        self.diversity_weight = diversity_weight
+        self.stagnation = stagnation
+        self.min_merge_interval = min_merge_interval
+        self.max_merge_interval = max_merge_interval  # None: the when_merge of the experiment
+        self.patience = patience  # None: never stop early
+        self.min_std = min_std
+        self.tolerance = tolerance
+        self.init()
+
+    def init(self):
+        self.split_generation = None  # generation of the last split
+        self.merge_generation = 0  # generation of the last merge
+        self.best = -math.inf  # best fitness observed in the run
+        self.best_generation = 0
+        self.history = []  # per subpopulation: best fitness of the last window + 1 generations
+        self.stagnant = []  # per subpopulation: generations since its best fitness improved
+        self.std = []  # per subpopulation: the last fitness standard deviation
+
+    def split(self, generation, num_subpopulations):
+        # subpopulations are new individuals, their history starts again
+        self.split_generation = generation
+        self.history = [deque(maxlen=self.window + 1) for _ in range(num_subpopulations)]
+        self.stagnant = [0] * num_subpopulations
+        self.std = [0.0] * num_subpopulations
+
+    def should_split(self, generation):
+        return self.split_generation is None or self.merge_generation == generation - 1
+
+    def observe(self, moments: List[FitnessMoments], generation):
+        for k, m in enumerate(moments):
+            if m.count == 0:
+                continue
+            if np.ndim(m.max):
+                raise ValueError("BudgetScheduler needs scalar fitness, not %d objectives" % len(m.max))
+            history = self.history[k]
+            if history and m.max <= max(history) + self.tolerance:
+                self.stagnant[k] += 1
+            else:
+                self.stagnant[k] = 0
+            history.append(m.max)
+            self.std[k] = m.std
+            if m.max > self.best + self.tolerance:
+                self.best, self.best_generation = m.max, generation
+
+    def scores(self):
+        scale = float(np.mean(self.std)) if self.std else 0.0
+        if not scale > 0:
+            return np.zeros(len(self.history))
+        improvement = np.array([(h[-1] - h[0]) / (len(h) - 1) if len(h) > 1 else 0.0 for h in self.history])
+        return np.maximum(improvement, 0.0) / scale + self.diversity_weight * np.array(self.std) / scale
+
+    def budgets(self, total):
+        # offspring of every subpopulation in the next generation, they add up to total
+        n = len(self.history)
+        scores = self.scores()
+        weights = np.full(n, 1.0 / n)
+        if scores.sum() > 0:
+            weights = self.min_share * weights + (1 - self.min_share) * scores / scores.sum()
+        extra = max(total - n * self.min_size, 0)
+        shares = min(self.min_size, total / n) + extra * weights
+        res = np.floor(shares).astype(int)
+        # the largest remainders get the rest
+        for k in np.argsort(res - shares, kind="stable")[:total - res.sum()]:
+            res[k] += 1
+        return res.tolist()
+
+    def should_merge(self, generation):
+        since_split = generation - self.split_generation + 1
+        if since_split < self.min_merge_interval:
+            return False
+        if self.max_merge_interval is not None and since_split >= self.max_merge_interval:
+            return True
+        return all(s >= self.stagnation for s in self.stagnant)
+
+    def merged(self, generation):
+        self.merge_generation = generation
+
+    def converged(self, generation):
+        if self.patience is not None and generation - self.best_generation >= self.patience:
+            return True
+        return self.min_std is not None and bool(self.std) and max(self.std) < self.min_std
+
+    def checkpoint_state(self):
+        return {"split_generation": self.split_generation, "merge_generation": self.merge_generation,
+                "best": self.best, "best_generation": self.best_generation,
+                "history": [list(h) for h in self.history], "stagnant": list(self.stagnant), "std": list(self.std)}
+
+    def restore_checkpoint_state(self, state):
+        self.split(state["split_generation"], len(state["history"]))
+        self.merge_generation = state["merge_generation"]
+        self.best, self.best_generation = state["best"], state["best_generation"]
+        for history, values in zip(self.history, state["history"]):
+            history.extend(values)
+        self.stagnant = list(state["stagnant"])
+        self.std = list(state["std"])
@@ -0,0 +1,74 @@
+import os
+import pickle
+
+import numpy as np
+
+from evolalg.base.array_population import ArrayPopulation, numeric_column
+from evolalg.base.individual import Individual
+
+CHECKPOINT_VERSION = 1
+
+
+def encode_strings(strings):
+    # variable-length strings as one utf-8 buffer and the offsets of their ends
+    encoded = [s.encode() for s in strings]
+    offsets = np.cumsum([len(e) for e in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(data, offsets):
+    data = bytes(data)
+    starts = np.concatenate(([0], offsets[:-1]))
+    return [data[start:end].decode() for start, end in zip(starts.tolist(), np.asarray(offsets).tolist())]
+
+
+def population_to_columns(population, fit_attr="fitness"):
+    if isinstance(population, ArrayPopulation):
+        genotypes, offsets = encode_strings(population.genotypes)
+        return {"genotypes": genotypes, "offsets": offsets, "fitness": population.fitness_array(fit_attr).copy()}
+    genotypes, offsets = encode_strings([ind.genotype for ind in population])
+    fitness = numeric_column([getattr(ind, fit_attr, None) for ind in population])
+    return {"genotypes": genotypes, "offsets": offsets, "fitness": fitness}
+
+
+def columns_to_population(columns, fit_attr="fitness", array_population=False):
+    if array_population:
+        return ArrayPopulation(decode_strings(columns["genotypes"], columns["offsets"]),
+                               {fit_attr: np.array(columns["fitness"], dtype=float)}, (fit_attr,))
+    population = []
+    for genotype, fitness in zip(decode_strings(columns["genotypes"], columns["offsets"]), columns["fitness"].tolist()):
+        ind = Individual(genotype)
+        if isinstance(fitness, list):  # multi-objective
+            fitness = None if np.isnan(fitness).all() else tuple(fitness)
+        elif np.isnan(fitness):
+            fitness = None
+        setattr(ind, fit_attr, fitness)
+        population.append(ind)
+    return population
+
+
+def write_atomic(path, data: bytes):
+    # the old checkpoint is replaced only after the new one was completely written (e.g. enough free space on device)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_state(path, state):
+    try:
+        write_atomic(path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception as ex:
+        raise RuntimeError(
+            "Failed to save checkpoint '%s' (because: %s). This does not prevent the experiment from continuing, but let's stop here to fix the problem with saving checkpoints." % (
+                path, ex))
+
+
+def load_state(path):
+    with open(path, "rb") as file:
+        state = pickle.load(file)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError("Unsupported checkpoint version %s in '%s'" % (state.get("version"), path))
+    return state
@@ -0,0 +1,18 @@
+import copy
+
+
+def clone_individual(individual):
+    # Shallow, copy-on-write clone: the new individual gets its own attribute dictionary, but the values
+    # (genotype, fitness, and any large custom fields like "recording") are shared with the original.
+    # This is safe as long as steps assign new values (ind.genotype = ..., setattr(ind, "fitness", ...))
+    # instead of modifying the shared ones in place, which is what mutation, crossover and evaluation do.
+    clone = getattr(individual, "clone", None)
+    if clone is not None:
+        return clone()
+    cls = type(individual)
+    try:
+        res = cls.__new__(cls)
+        res.__dict__.update(individual.__dict__)
+    except AttributeError:  # no __dict__, e.g. classes with __slots__
+        res = copy.copy(individual)
+    return res
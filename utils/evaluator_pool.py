@@ -0,0 +1,74 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+from evolalg.base.step import Step
+
+_evaluator = None  # the evaluator of the current worker process
+
+
+def _make_evaluator(evaluator_factory):
+    evaluator = evaluator_factory()
+    if isinstance(evaluator, Step):
+        evaluator.init()
+    return evaluator
+
+
+def _init_process(evaluator_factory):
+    global _evaluator
+    _evaluator = _make_evaluator(evaluator_factory)
+
+
+def _evaluate_in_process(population):
+    return _evaluator(population)
+
+
+class EvaluatorPool:
+    """Long-lived evaluators, each built once by evaluator_factory (so each with its own FramsticksLib).
+
+    evaluator_factory returns a step (e.g. FitnessStep followed by FieldRemove) that takes and returns a list of
+    individuals. With use_processes the evaluators live in spawned processes and evaluator_factory has to be
+    picklable; otherwise they live in threads, one evaluator per thread.
+    """
+
+    def __init__(self, evaluator_factory: Callable, num_evaluators=2, use_processes=True):
+        self.evaluator_factory = evaluator_factory
+        self.num_evaluators = num_evaluators
+        self.use_processes = use_processes
+        self._executor = None
+        self._local = None
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.use_processes:
+            self._executor = ProcessPoolExecutor(self.num_evaluators, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_process, initargs=(self.evaluator_factory,))
+        else:
+            self._local = threading.local()
+            self._executor = ThreadPoolExecutor(self.num_evaluators)
+
+    def _evaluate_in_thread(self, population):
+        evaluator = getattr(self._local, "evaluator", None)
+        if evaluator is None:
+            evaluator = self._local.evaluator = _make_evaluator(self.evaluator_factory)
+        return evaluator(population)
+
+    def submit(self, population) -> Future:
+        self.start()
+        if self.use_processes:
+            return self._executor.submit(_evaluate_in_process, population)
+        return self._executor.submit(self._evaluate_in_thread, population)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._local = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_local"] = None
+        return state
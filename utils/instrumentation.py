@@ -0,0 +1,175 @@
+import cProfile
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from evolalg.base.step import Step
+from evolalg.base.union_step import UnionStep
+
+FIELDS = ["generation", "subpopulation", "stage", "calls", "wall", "cpu", "individuals_in", "individuals_out"]
+
+
+def _size(population):
+    try:
+        return len(population)
+    except TypeError:
+        return 1 if population is not None else 0
+
+
+class Instrumentation:
+    """Wall/CPU time, call counts and individuals processed, per stage, subpopulation and generation.
+
+    generation and subpopulation are set by the experiment and attached to every measurement. Rows are aggregated
+    until end_generation(), which appends them to log_path (JSONL, or CSV when the name ends with .csv).
+    Stages named in profile_stages additionally run under cProfile; see dump_profiles().
+    When enabled is False, measure() and InstrumentedStep only forward the call.
+    """
+
+    def __init__(self, enabled=True, log_path=None, profile_stages=()):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.profile_stages = set(profile_stages)
+        self.generation = None
+        self.subpopulation = None
+        self.profiles = {}
+        self.totals = {}  # stage -> [calls, wall, cpu, individuals_in, individuals_out] over the whole run
+        self._rows = {}
+        self._profiling = False
+
+    def record(self, stage, wall, cpu, individuals_in, individuals_out, calls=1, generation=None, subpopulation=None):
+        if generation is None:
+            generation = self.generation
+        if subpopulation is None:
+            subpopulation = self.subpopulation
+        for key, table in (((generation, subpopulation, stage), self._rows), (stage, self.totals)):
+            row = table.setdefault(key, [0, 0.0, 0.0, 0, 0])
+            row[0] += calls
+            row[1] += wall
+            row[2] += cpu
+            row[3] += individuals_in
+            row[4] += individuals_out
+
+    @contextmanager
+    def _measure(self, stage, population):
+        profile = None
+        if stage in self.profile_stages and not self._profiling:  # cProfile cannot profile nested stages twice
+            profile = self.profiles.setdefault(stage, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = [None]
+        try:
+            yield result
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            individuals_in = _size(population)
+            # stages that do not report their output are assumed to pass all individuals on
+            self.record(stage, wall, cpu, individuals_in, individuals_in if result[0] is None else _size(result[0]))
+
+    def measure(self, stage, population=None):
+        # with instrumentation.measure("stage", population) as result: result[0] = output (optional)
+        if not self.enabled:
+            return _NOT_MEASURED
+        return self._measure(stage, population)
+
+    def rows(self):
+        return [dict(zip(FIELDS, [generation, subpopulation, stage] + values))
+                for (generation, subpopulation, stage), values in self._rows.items()]
+
+    def take_rows(self):
+        res = self.rows()
+        self._rows = {}
+        return res
+
+    def add_rows(self, rows):
+        # merges rows measured elsewhere, e.g. in worker processes
+        for row in rows:
+            self.record(row["stage"], row["wall"], row["cpu"], row["individuals_in"], row["individuals_out"],
+                        row["calls"], row["generation"], row["subpopulation"])
+
+    def end_generation(self):
+        rows = self.take_rows()
+        if not rows or self.log_path is None:
+            return rows
+        if self.log_path.endswith(".csv"):
+            new_file = not os.path.exists(self.log_path)
+            with open(self.log_path, "a", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=FIELDS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(self.log_path, "a") as file:
+                for row in rows:
+                    file.write(json.dumps(row) + "\n")
+        return rows
+
+    def summary(self):
+        return {stage: dict(zip(FIELDS[3:], values)) for stage, values in self.totals.items()}
+
+    def dump_profiles(self, directory):
+        # one <stage>.prof file per profiled stage, readable with pstats or snakeviz
+        for stage, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(directory, "%s.prof" % stage.replace("/", "_")))
+
+
+class _NotMeasured:
+    def __enter__(self):
+        return [None]
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NOT_MEASURED = _NotMeasured()
+
+
+def stage_name(step):
+    if isinstance(step, InstrumentedStep):
+        return step.name
+    return getattr(step, "__name__", type(step).__name__)
+
+
+class InstrumentedStep(Step):
+    def __init__(self, step, instrumentation: Instrumentation, name=None):
+        self.step = step
+        self.instrumentation = instrumentation
+        self.name = name if name is not None else stage_name(step)
+
+    def init(self):
+        if isinstance(self.step, Step):
+            self.step.init()
+
+    def call(self, population, *args, **kwargs):
+        if not self.instrumentation.enabled:
+            return self.step(population, *args, **kwargs)
+        with self.instrumentation.measure(self.name, population) as result:
+            result[0] = self.step(population, *args, **kwargs)
+        return result[0]
+
+    def __getattr__(self, name):
+        # everything else (fields, halloffame, stats(), ...) comes from the wrapped step
+        if name == "step":
+            raise AttributeError(name)
+        return getattr(self.step, name)
+
+
+def instrument(step, instrumentation: Instrumentation, name=None):
+    # UnionSteps are instrumented in place, stage by stage, so nested stages get their own measurements
+    if isinstance(step, UnionStep):
+        step.steps = [instrument(s, instrumentation) for s in step.steps]
+        return step
+    if isinstance(step, InstrumentedStep):
+        return step
+    return InstrumentedStep(step, instrumentation, name)
+
+
+def instrument_generation(stable_generation, instrumentation: Instrumentation):
+    stable_generation.selection = instrument(stable_generation.selection, instrumentation, "selection")
+    instrument(stable_generation.steps, instrumentation)
+    return stable_generation
@@ -0,0 +1,408 @@
+import math
+import multiprocessing
+import pickle
+import queue
+import socket
+import struct
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from evolalg.base.array_population import ArrayPopulation
+from evolalg.utils.clone import clone_individual
+from evolalg.utils.pareto import selection_key
+from evolalg.utils.stable_generation import StableGeneration
+
+
+# Topologies map every island to the list of islands it sends its emigrants to.
+
+def ring_topology(num_islands, rng):
+    return {i: [(i + 1) % num_islands] for i in range(num_islands) if num_islands > 1}
+
+
+def random_topology(num_islands, rng):
+    # every island sends to one other island drawn at random
+    res = {}
+    for i in range(num_islands):
+        others = [j for j in range(num_islands) if j != i]
+        if others:
+            res[i] = [others[rng.integers(len(others))]]
+    return res
+
+
+def fully_connected_topology(num_islands, rng):
+    return {i: [j for j in range(num_islands) if j != i] for i in range(num_islands)}
+
+
+TOPOLOGIES = {"ring": ring_topology, "random": random_topology, "full": fully_connected_topology}
+
+
+class Migration:
+    """Every interval generations, each island sends copies of its best rate * size individuals to the islands
+    given by the topology; immigrants replace the worst individuals of the receiving island.
+
+    The topology of a migration depends only on seed and the generation, so islands running in separate processes
+    or on separate machines agree on who sends to whom without talking to each other.
+    """
+
+    def __init__(self, topology="ring", rate=0.1, interval=5, fit_attr="fitness", seed=0):
+        if topology not in TOPOLOGIES:
+            raise ValueError("Unknown topology '%s', available: %s" % (topology, ", ".join(sorted(TOPOLOGIES))))
+        self.topology = topology
+        self.rate = rate
+        self.interval = interval
+        self.fit_attr = fit_attr
+        self.seed = seed
+
+    def is_migration_generation(self, generation):
+        return generation % self.interval == 0
+
+    def destinations(self, num_islands, generation) -> Dict[int, List[int]]:
+        rng = np.random.default_rng([self.seed, generation])
+        return TOPOLOGIES[self.topology](num_islands, rng)
+
+    @staticmethod
+    def sources(island, destinations):
+        return sorted(source for source, targets in destinations.items() if island in targets)
+
+    def emigrants(self, population):
+        if len(population) == 0:
+            return []
+        count = min(len(population), math.ceil(self.rate * len(population)))
+        best = np.argsort(selection_key(population, self.fit_attr), kind="stable")[::-1][:count]
+        return [clone_individual(population[i]) for i in best]
+
+    def integrate(self, population, immigrants):
+        count = min(len(population), len(immigrants))
+        worst = np.argsort(selection_key(population, self.fit_attr), kind="stable")[:count]
+        if isinstance(population, ArrayPopulation):
+            return population.replace(worst, immigrants[:count])
+        population = list(population)
+        for i, ind in zip(worst, immigrants[:count]):
+            population[i] = ind
+        return population
+
+    def migrate(self, subpopulations, generation):
+        # all islands in one process: emigrants are chosen first, so that nobody sends on what it just received
+        destinations = self.destinations(len(subpopulations), generation)
+        emigrants = [self.emigrants(subp) for subp in subpopulations]
+        res = []
+        for island, subp in enumerate(subpopulations):
+            immigrants = [ind for source in self.sources(island, destinations) for ind in emigrants[source]]
+            res.append(self.integrate(subp, immigrants))
+        return res
+
+
+class Transport:
+    """Delivers emigrants between islands. Messages are (generation, source, individuals).
+
+    receive() raises TimeoutError when the messages of a generation did not come within receive_timeout seconds
+    (None: wait forever), e.g. because the sending island failed.
+    """
+
+    poll_interval = 1.0  # seconds between checks for errors of this transport while waiting for messages
+
+    def __init__(self, receive_timeout=600):
+        self.receive_timeout = receive_timeout
+        self._pending = {}
+
+    def send(self, source, destination, generation, individuals):
+        raise NotImplementedError
+
+    def _next_message(self, island, timeout):
+        # the next message for island, or None when none came within timeout seconds
+        raise NotImplementedError
+
+    def check(self):
+        # raises the errors of sending in the background, if any
+        pass
+
+    def receive(self, island, sources, generation) -> list:
+        # blocks until a message from every source for this generation came; other messages wait for their turn
+        expected = set(sources)
+        received = {}
+        for source in list(expected):
+            if (generation, source) in self._pending:
+                received[source] = self._pending.pop((generation, source))
+        deadline = time.monotonic() + self.receive_timeout if self.receive_timeout is not None else None
+        while len(received) < len(expected):
+            self.check()
+            timeout = self.poll_interval
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("Island %d received no emigrants of generation %d from islands %s within %s s"
+                                       % (island, generation, sorted(expected - set(received)),
+                                          self.receive_timeout))
+                timeout = min(timeout, deadline - time.monotonic())
+            message = self._next_message(island, max(0, timeout))
+            if message is None:
+                continue
+            message_generation, source, individuals = message
+            if message_generation == generation and source in expected:
+                received[source] = individuals
+            else:
+                self._pending[(message_generation, source)] = individuals
+        return [ind for source in sorted(received) for ind in received[source]]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class QueueTransport(Transport):
+    # islands running as threads of one process
+    def __init__(self, num_islands, receive_timeout=600):
+        super(QueueTransport, self).__init__(receive_timeout)
+        self.queues = [queue.Queue() for _ in range(num_islands)]
+
+    def send(self, source, destination, generation, individuals):
+        self.queues[destination].put((generation, source, individuals))
+
+    def _next_message(self, island, timeout):
+        try:
+            return self.queues[island].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _SendingTransport(Transport):
+    # sends in background threads, so that two islands sending large messages to each other cannot block each other;
+    # an error of a sender is raised by the next send(), flush() or receive()
+    def __init__(self, receive_timeout=600):
+        super(_SendingTransport, self).__init__(receive_timeout)
+        self._senders = []
+        self._errors = []  # (destination, exception) of the failed senders
+
+    def _send(self, destination, message):
+        raise NotImplementedError
+
+    def _send_in_background(self, destination, message):
+        try:
+            self._send(destination, message)
+        except Exception as ex:
+            self._errors.append((destination, ex))
+
+    def check(self):
+        if self._errors:
+            destination, ex = self._errors[0]
+            self._errors = []
+            raise RuntimeError("Island %d: sending emigrants to island %d failed: %r"
+                               % (self.island, destination, ex)) from ex
+
+    def send(self, source, destination, generation, individuals):
+        self.check()
+        sender = threading.Thread(target=self._send_in_background,
+                                  args=(destination, (generation, source, individuals)), daemon=True)
+        sender.start()
+        self._senders.append(sender)
+
+    def flush(self):
+        for sender in self._senders:
+            sender.join()
+        self._senders = []
+        self.check()
+
+    def close(self):
+        try:
+            self.flush()
+        except RuntimeError as ex:
+            print("Warning:", ex)
+
+
+class PipeTransport(_SendingTransport):
+    # islands running as local processes, connected by a full mesh of multiprocessing pipes; see create()
+    def __init__(self, island, connections, receive_timeout=600):
+        super(PipeTransport, self).__init__(receive_timeout)
+        self.island = island
+        self.connections = connections  # other island -> Connection
+
+    @staticmethod
+    def create(num_islands, context=None, receive_timeout=600):
+        context = context if context is not None else multiprocessing.get_context("spawn")
+        connections = [{} for _ in range(num_islands)]
+        for i in range(num_islands):
+            for j in range(i + 1, num_islands):
+                connections[i][j], connections[j][i] = context.Pipe()
+        return [PipeTransport(i, connections[i], receive_timeout) for i in range(num_islands)]
+
+    def _send(self, destination, message):
+        self.connections[destination].send(message)
+
+    def _next_message(self, island, timeout):
+        ready = wait(list(self.connections.values()), timeout)
+        return ready[0].recv() if ready else None
+
+    def close(self):
+        super(PipeTransport, self).close()
+        for connection in self.connections.values():
+            connection.close()
+
+
+class SocketTransport(_SendingTransport):
+    """Islands on this or other machines; addresses[i] is the (host, port) island i listens on.
+
+    Messages are pickled, so use it only between machines you trust.
+    """
+
+    def __init__(self, island, addresses, connect_timeout=60, receive_timeout=600):
+        super(SocketTransport, self).__init__(receive_timeout)
+        self.island = island
+        self.addresses = addresses
+        self.connect_timeout = connect_timeout
+        self._inbox = queue.Queue()
+        self._server = None
+
+    def start(self):
+        host, port = self.addresses[self.island]
+        self._server = socket.create_server((host, port))
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:  # server closed
+                return
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _read_exactly(conn, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise EOFError("connection closed")
+            data.extend(chunk)
+        return bytes(data)
+
+    def _read(self, conn):
+        with conn:
+            (size,) = struct.unpack("!Q", self._read_exactly(conn, 8))
+            self._inbox.put(pickle.loads(self._read_exactly(conn, size)))
+
+    def _send(self, destination, message):
+        data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                conn = socket.create_connection(self.addresses[destination])
+                break
+            except OSError:
+                if time.monotonic() > deadline:  # the other island did not start listening in time
+                    raise
+                time.sleep(0.1)
+        with conn:
+            conn.sendall(struct.pack("!Q", len(data)) + data)
+
+    def _next_message(self, island, timeout):
+        if self._server is None:
+            self.start()
+        try:
+            return self._inbox.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        super(SocketTransport, self).close()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    def __getstate__(self):
+        # only the configuration travels to the island's process, which starts its own server there
+        return {"island": self.island, "addresses": self.addresses, "connect_timeout": self.connect_timeout,
+                "receive_timeout": self.receive_timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class Island:
+    """One island of the island model: evolves its own population and exchanges only emigrants."""
+
+    def __init__(self, island, num_islands, step, migration: Migration, transport: Transport,
+                 generation_modification: Callable = None):
+        self.island = island
+        self.num_islands = num_islands
+        self.step = step
+        self.migration = migration
+        self.transport = transport
+        self.generation_modification = generation_modification
+
+    def run(self, population, num_generations, first_generation=1):
+        if isinstance(self.transport, SocketTransport) and self.transport._server is None:
+            self.transport.start()  # listen before anybody may want to send
+        for generation in range(first_generation, num_generations + 1):
+            population = self.step(population)
+            if self.generation_modification is not None:
+                population = self.generation_modification(population)
+            if self.migration.is_migration_generation(generation):
+                destinations = self.migration.destinations(self.num_islands, generation)
+                emigrants = self.migration.emigrants(population)
+                for destination in destinations.get(self.island, []):
+                    self.transport.send(self.island, destination, generation, emigrants)
+                immigrants = self.transport.receive(self.island, self.migration.sources(self.island, destinations),
+                                                    generation)
+                population = self.migration.integrate(population, immigrants)
+                self.transport.flush()
+        self.transport.flush()
+        return population
+
+
+def _island_process(island, num_islands, worker_setup, population_size, migration, transport, population,
+                    num_generations, results):
+    selection, steps = worker_setup()
+    step = StableGeneration(selection=selection, steps=steps, population_size=population_size)
+    step.init()
+    try:
+        population = Island(island, num_islands, step, migration, transport).run(population, num_generations)
+        results.put((island, True, population))
+    except Exception as ex:
+        results.put((island, False, repr(ex)))
+    finally:
+        transport.close()
+
+
+def run_local_islands(worker_setup, populations, migration: Migration, num_generations, population_size,
+                      transport="pipe", host="127.0.0.1", base_port=50000, receive_timeout=600):
+    """Runs every population as an island in its own local process, exchanging emigrants through multiprocessing
+    pipes (transport="pipe") or local TCP sockets (transport="socket", island i listens on base_port + i).
+    worker_setup is called in every process and returns (selection, new_generation_steps), as for MultiExperiment.
+    An island that waits longer than receive_timeout seconds for its immigrants fails, and so does the run.
+    Returns the final populations.
+    """
+    context = multiprocessing.get_context("spawn")
+    num_islands = len(populations)
+    if transport == "pipe":
+        transports = PipeTransport.create(num_islands, context, receive_timeout)
+    elif transport == "socket":
+        addresses = [(host, base_port + i) for i in range(num_islands)]
+        transports = [SocketTransport(i, addresses, receive_timeout=receive_timeout) for i in range(num_islands)]
+    else:
+        raise ValueError("Unknown transport '%s', use 'pipe' or 'socket'" % transport)
+    results = context.Queue()
+    processes = [context.Process(target=_island_process,
+                                 args=(i, num_islands, worker_setup, population_size, migration, transports[i],
+                                       list(populations[i]), num_generations, results), daemon=True)
+                 for i in range(num_islands)]
+    for process in processes:
+        process.start()
+    res = [None] * num_islands
+    try:
+        for _ in range(num_islands):
+            island, ok, payload = results.get()
+            if not ok:
+                # the other islands would wait forever for its emigrants
+                raise RuntimeError("Island model failed (island %d: %s)" % (island, payload))
+            res[island] = payload
+    finally:
+        for process in processes:
+            if any(r is None for r in res):
+                process.terminate()
+            process.join()
+    return res
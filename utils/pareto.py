@@ -0,0 +1,216 @@
+import numpy as np
+
+from evolalg.base.array_population import ArrayPopulation, numeric_column
+
+# Multi-objective mode: the fitness of an individual is a tuple of criteria, all maximized. A population gives an
+# (n x m) objective matrix; non-dominated sorting assigns every row its front rank (0: not dominated by any other
+# row) and crowding distance tells apart the rows of one front. pareto_scores() turns both into one scalar per
+# individual (higher is better), so everything that sorts by fitness (splitting, ConvectionSelection, migration)
+# sorts by front and then by crowding distance.
+
+
+def objective_values(population, fit_attr="fitness"):
+    # fitness of the population as a float array: 1D for scalar fitness, (n x m) for tuples, NaN for None
+    if isinstance(population, ArrayPopulation):
+        return population.fitness_array(fit_attr)
+    return numeric_column([getattr(ind, fit_attr, None) for ind in population])
+
+
+def _distinct(objectives):
+    # distinct objective vectors in descending lexicographic order: a vector can only be dominated by earlier ones
+    objectives = np.where(np.isnan(objectives), -np.inf, objectives)  # no fitness: dominated by everything
+    vectors, inverse, counts = np.unique(objectives, axis=0, return_inverse=True, return_counts=True)
+    last = len(vectors) - 1
+    return vectors[::-1], last - inverse.reshape(-1), counts[::-1]
+
+
+def _weakly_dominates(rows, columns):
+    # res[a, b]: rows[a] >= columns[b] in every objective; (rows x objectives) and (objectives x n) arrays
+    res = rows[:, 0, None] >= columns[0][None]
+    for j in range(1, len(columns)):
+        res &= rows[:, j, None] >= columns[j][None]
+    return res
+
+
+def _dominated_by_any(changed, vectors, chunk_size=1 << 22):
+    # mask of the vectors dominated by at least one of the changed vectors
+    res = np.zeros(len(vectors), dtype=bool)
+    columns = np.ascontiguousarray(vectors.T)
+    step = max(1, chunk_size // max(1, len(vectors)))
+    for start in range(0, len(changed), step):
+        block = changed[start:start + step]
+        res |= (_weakly_dominates(block, columns) & ~_weakly_dominates(-block, -columns)).any(axis=0)
+    return res
+
+
+def _assign_ranks(vectors, ranks, todo, chunk_size=1 << 22, max_block=256, max_passes=8):
+    # rank of a vector = 1 + the highest rank among its dominators (all of them precede it in the sorted order);
+    # rows not in todo must already have their final rank. Rows are ranked in blocks: the dominators ranked before
+    # the block are found by one broadcast comparison, only those inside the block are resolved row by row.
+    todo = np.nonzero(todo)[0]
+    columns = np.ascontiguousarray(vectors.T)
+    block_size = min(max_block, max(1, chunk_size // (len(vectors) + 1)))
+    for start in range(0, len(todo), block_size):
+        block = todo[start:start + block_size]
+        end = int(block[-1])
+        # distinct vectors: >= everywhere means dominates
+        dominates = _weakly_dominates(-vectors[block], -columns[:, :end])
+        earlier = ranks[:end].copy()
+        earlier[block[block < end]] = -1  # not ranked yet
+        best = np.where(dominates, earlier[None], -1).max(axis=1, initial=-1)
+        # dominators inside the block: relaxed until no rank grows, which takes as many passes as the longest chain
+        # of them; long chains are resolved row by row
+        inside = np.zeros((len(block), len(block)), dtype=bool)
+        inside[:, :-1] = np.tril(dominates[:, block[:-1]], -1)  # [j, k]: block[k] dominates block[j]
+        local = best + 1
+        for _ in range(max_passes):
+            relaxed = np.maximum(local, np.where(inside, local[None], -1).max(axis=1) + 1)
+            if np.array_equal(relaxed, local):
+                break
+            local = relaxed
+        else:
+            for j in range(1, len(block)):
+                if inside[j, :j].any():
+                    local[j] = max(local[j], local[:j][inside[j, :j]].max() + 1)
+        ranks[block] = local
+    return ranks
+
+
+def non_dominated_ranks(objectives):
+    # front rank of every row of an (n x m) objective matrix, computed from scratch
+    objectives = np.asarray(objectives, dtype=float)
+    if len(objectives) == 0:
+        return np.zeros(0, dtype=np.intp)
+    vectors, inverse, _ = _distinct(objectives)
+    ranks = _assign_ranks(vectors, np.zeros(len(vectors), dtype=np.intp), np.ones(len(vectors), dtype=bool))
+    return ranks[inverse]
+
+
+def crowding_distance(vectors, ranks):
+    # NSGA-II crowding distance of distinct objective vectors within their fronts; the extremes of a front get inf
+    res = np.zeros(len(vectors))
+    order = np.argsort(ranks, kind="stable")
+    bounds = np.flatnonzero(np.diff(ranks[order])) + 1
+    for front in np.split(order, bounds):
+        if len(front) <= 2:
+            res[front] = np.inf
+            continue
+        values = vectors[front]
+        for j in range(values.shape[1]):
+            by_objective = np.argsort(values[:, j], kind="stable")
+            column = values[by_objective, j]
+            res[front[by_objective[[0, -1]]]] = np.inf
+            span = column[-1] - column[0]
+            if np.isfinite(span) and span > 0:
+                res[front[by_objective[1:-1]]] += (column[2:] - column[:-2]) / span
+    return res
+
+
+class ParetoFronts:
+    """Front ranks of the distinct objective vectors of a population, kept up to date between calls of update().
+
+    The rank of a vector depends only on the vectors that dominate it, so after the population changed only the
+    new vectors and those dominated by a new or a removed vector are ranked again; the rest keep their rank.
+    Copies of one vector (e.g. clones of a parent) are ranked once, and repeated calls on one population cost
+    nothing. An instance has to follow a single population; see ParetoFrontsPool for callers that see several.
+    """
+
+    def __init__(self):
+        self.init()
+
+    def init(self):
+        self._ranks = {}  # objective vector (tuple) -> front rank
+        self._objectives = None
+        self.vectors = np.zeros((0, 0))  # distinct objective vectors, descending lexicographic order
+        self.counts = np.zeros(0, dtype=np.intp)  # how many individuals have each vector
+        self.ranks = np.zeros(0, dtype=np.intp)  # front rank of each vector
+        self.inverse = np.zeros(0, dtype=np.intp)  # row of the population -> its vector
+        self.reranked = 0  # vectors ranked by the last update
+
+    def update(self, objectives):
+        objectives = np.asarray(objectives, dtype=float)
+        if self._objectives is not None and np.array_equal(objectives, self._objectives, equal_nan=True):
+            self.reranked = 0
+            return self
+        vectors, inverse, counts = _distinct(objectives.reshape(len(objectives), -1))
+        keys = [tuple(v) for v in vectors.tolist()]
+        present = set(keys)
+        known = np.array([key in self._ranks for key in keys], dtype=bool)
+        removed = [key for key in self._ranks if key not in present]
+        changed = np.concatenate((vectors[~known], np.array(removed, dtype=float).reshape(-1, vectors.shape[1])))
+        todo = ~known
+        if len(changed) and known.any():
+            todo |= _dominated_by_any(changed, vectors)
+        ranks = np.array([self._ranks.get(key, 0) for key in keys], dtype=np.intp)
+        _assign_ranks(vectors, ranks, todo)
+        self._ranks = dict(zip(keys, ranks.tolist()))
+        self._objectives = objectives.copy()
+        self.vectors, self.counts, self.ranks, self.inverse = vectors, counts, ranks, inverse
+        self.reranked = int(todo.sum())
+        return self
+
+    def front_ranks(self):
+        # front rank of every individual of the last update
+        return self.ranks[self.inverse]
+
+    def scores(self):
+        # one scalar per individual of the last update: -front rank plus the position of its crowding distance
+        # within the front scaled to [0, 1), so a better front always wins and the less crowded wins inside a front
+        if len(self.vectors) == 0:
+            return np.zeros(0)
+        crowding = crowding_distance(self.vectors, self.ranks)
+        order = np.lexsort((crowding, self.ranks))  # by front, then by crowding distance ascending
+        front_sizes = np.bincount(self.ranks)
+        front_starts = np.concatenate(([0], np.cumsum(front_sizes)[:-1]))
+        position = np.empty(len(order))
+        position[order] = np.arange(len(order)) - front_starts[self.ranks[order]]
+        return (-self.ranks + position / front_sizes[self.ranks])[self.inverse]
+
+
+class ParetoFrontsPool:
+    """ParetoFronts for several populations seen in turn, e.g. by one selection used for every subpopulation.
+
+    update() goes to the instance whose last population differs least from the new one (fewest objective vectors
+    added and removed), so every subpopulation is diffed against its own previous state and not against the
+    subpopulation selected before it. A population for which no instance beats ranking from scratch gets a fresh
+    one; beyond size instances the least recently used one is replaced.
+    ConvectionSelection and ParetoTournamentSelection keep one pool each.
+    """
+
+    def __init__(self, size=32):
+        self.size = size
+        self.init()
+
+    def init(self):
+        self._fronts = []  # most recently used last
+
+    def update(self, objectives):
+        objectives = np.asarray(objectives, dtype=float)
+        vectors = np.where(np.isnan(objectives), -np.inf, objectives).reshape(len(objectives), -1)  # as in _distinct
+        keys = set(map(tuple, vectors.tolist()))
+        # vectors to rank again (roughly) when reusing an instance: those added and removed since its last update
+        changes = [len(keys) + len(fronts._ranks) - 2 * sum(key in fronts._ranks for key in keys)
+                   for fronts in self._fronts]
+        if changes and min(changes) < len(keys):  # cheaper than ranking from scratch
+            fronts = self._fronts.pop(int(np.argmin(changes)))
+        elif len(self._fronts) >= self.size:
+            fronts = self._fronts.pop(0)
+            fronts.init()
+        else:
+            fronts = ParetoFronts()
+        self._fronts.append(fronts)
+        return fronts.update(objectives)
+
+
+def pareto_scores(objectives, fronts: ParetoFronts = None):
+    if fronts is None:
+        fronts = ParetoFronts()
+    return fronts.update(objectives).scores()
+
+
+def selection_key(population, fit_attr="fitness", fronts: ParetoFronts = None):
+    # the array populations are sorted by: fitness itself, or the Pareto score of multi-objective fitness
+    values = objective_values(population, fit_attr)
+    if values.ndim == 2:
+        return pareto_scores(values, fronts)
+    return values
@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+
+from evolalg.base.array_population import ArrayPopulation
+from evolalg.utils.background import BackgroundWriter
+from evolalg.utils.checkpoint import decode_strings, encode_strings
+from evolalg.utils.pareto import objective_values
+
+# A population log is two append-only files:
+#  - path: chunks, one per logged (sub)population: fitness (float64, NaN for None; count x objectives values for
+#    multi-objective fitness), the end offsets of the genotypes (int64) and the utf-8 genotypes, each chunk padded
+#    to a multiple of 8 bytes;
+#  - path + ".index": a header followed by one INDEX_DTYPE record per chunk, with its place in the data file and
+#    a summary (best, mean; of the first objective for multi-objective fitness), so that questions like "best
+#    fitness per island per generation" are answered from the memory-mapped index alone.
+# A chunk is written before its index record, so the index never points past the end of the data.
+
+INDEX_MAGIC = b"EVOLOG02"
+INDEX_HEADER_SIZE = 16
+INDEX_DTYPE = np.dtype([("generation", "<i8"), ("subpopulation", "<i4"), ("phase", "<i4"), ("count", "<i8"),
+                        ("offset", "<i8"), ("genotype_bytes", "<i8"), ("best", "<f8"), ("best_index", "<i8"),
+                        ("mean", "<f8"), ("objectives", "<i8")])
+PHASES = {"before": 0, "after": 1, "merged": 2}
+MERGED = -1  # subpopulation of the records of the merged population
+
+
+def _summary(fitness):
+    if fitness.ndim == 2:
+        fitness = fitness[:, 0] if fitness.shape[1] else np.full(len(fitness), np.nan)
+    valid = ~np.isnan(fitness)
+    if not valid.any():
+        return np.nan, -1, np.nan
+    best_index = int(np.nanargmax(fitness))
+    return float(fitness[best_index]), best_index, float(fitness[valid].mean())
+
+
+class PopulationLog:
+    """Appends the genotypes and fitness of (sub)populations to a chunked binary file with an index.
+
+    log() only takes the fitness array and the list of genotypes; encoding and writing happen in a BackgroundWriter
+    thread. phases selects which of the "before", "after" (per subpopulation) and "merged" snapshots MultiExperiment
+    logs. Read the log with PopulationLogReader.
+    """
+
+    def __init__(self, path, fit_attr="fitness", phases=("after", "merged"), writer: BackgroundWriter = None):
+        self.path = path
+        self.index_path = path + ".index"
+        self.fit_attr = fit_attr
+        self.phases = tuple(phases)
+        self.writer = writer if writer is not None else BackgroundWriter(max_pending=16)
+        if not os.path.exists(self.index_path):
+            with open(self.path, "wb"), open(self.index_path, "wb") as index:
+                index.write(INDEX_MAGIC.ljust(INDEX_HEADER_SIZE, b"\0"))
+
+    def log(self, population, generation, subpopulation=MERGED, phase="after"):
+        if phase not in self.phases:
+            return
+        fitness = np.array(objective_values(population, self.fit_attr), dtype=float)  # a copy, the population goes on
+        genotypes = list(population.genotypes) if isinstance(population, ArrayPopulation) \
+            else [ind.genotype for ind in population]
+        self.writer.submit(self._append, fitness, genotypes, generation, subpopulation, PHASES[phase])
+
+    def _append(self, fitness, genotypes, generation, subpopulation, phase):
+        data, offsets = encode_strings(genotypes)
+        chunk = fitness.astype("<f8").tobytes() + offsets.astype("<i8").tobytes() + data.tobytes()
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record["generation"], record["subpopulation"], record["phase"] = generation, subpopulation, phase
+        record["count"], record["genotype_bytes"] = len(fitness), len(data)
+        record["objectives"] = fitness.shape[1] if fitness.ndim == 2 else 1
+        record["best"], record["best_index"], record["mean"] = _summary(fitness)
+        with open(self.path, "ab") as file:
+            file.write(b"\0" * (-file.tell() % 8))  # after an interrupted write chunks start aligned again
+            record["offset"] = file.tell()
+            file.write(chunk + b"\0" * (-len(chunk) % 8))
+        with open(self.index_path, "ab") as index:
+            index.write(record.tobytes())
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+    def truncate(self, generation):
+        # drops everything logged after generation, e.g. when a run is resumed from a checkpoint of that generation
+        self.flush()
+        size = os.path.getsize(self.index_path) - INDEX_HEADER_SIZE
+        count = size // INDEX_DTYPE.itemsize
+        if count == 0:
+            return
+        index = np.fromfile(self.index_path, dtype=INDEX_DTYPE, count=count, offset=INDEX_HEADER_SIZE)
+        later = np.nonzero(index["generation"] > generation)[0]
+        keep = int(later[0]) if len(later) else count
+        data_size = int(index["offset"][keep]) if keep < count else os.path.getsize(self.path)
+        with open(self.index_path, "r+b") as file:
+            file.truncate(INDEX_HEADER_SIZE + keep * INDEX_DTYPE.itemsize)
+        with open(self.path, "r+b") as file:
+            file.truncate(data_size)
+
+
+class PopulationLogReader:
+    """Memory-mapped access to a log written by PopulationLog; nothing is read until it is needed."""
+
+    def __init__(self, path):
+        self.path = path
+        index_path = path + ".index"
+        with open(index_path, "rb") as file:
+            if file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError("'%s' is not a population log index" % index_path)
+        count = (os.path.getsize(index_path) - INDEX_HEADER_SIZE) // INDEX_DTYPE.itemsize  # a torn last record is ignored
+        self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", offset=INDEX_HEADER_SIZE, shape=(count,)) \
+            if count else np.zeros(0, dtype=INDEX_DTYPE)
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.index)
+
+    def select(self, generation=None, subpopulation=None, phase=None):
+        # indices of the records matching all the given criteria
+        mask = np.ones(len(self.index), dtype=bool)
+        if generation is not None:
+            mask &= self.index["generation"] == generation
+        if subpopulation is not None:
+            mask &= self.index["subpopulation"] == subpopulation
+        if phase is not None:
+            mask &= self.index["phase"] == PHASES[phase]
+        return np.nonzero(mask)[0]
+
+    def best_per_island(self, phase="after"):
+        # (generations, best) where best[g, k] is the best fitness of subpopulation k in generations[g] (NaN: not logged)
+        records = self.index[self.select(phase=phase)]
+        records = records[records["subpopulation"] >= 0]
+        generations, rows = np.unique(records["generation"], return_inverse=True)
+        best = np.full((len(generations), int(records["subpopulation"].max()) + 1 if len(records) else 0), np.nan)
+        best[rows, records["subpopulation"]] = records["best"]
+        return generations, best
+
+    def fitness(self, record):
+        # (count,) array, or (count x objectives) for multi-objective fitness
+        entry = self.index[record]
+        count, objectives = int(entry["count"]), int(entry["objectives"])
+        shape = (count, objectives) if objectives > 1 else count
+        return np.ndarray(shape, dtype="<f8", buffer=self.data, offset=int(entry["offset"]))
+
+    def genotypes(self, record):
+        entry = self.index[record]
+        count, offset = int(entry["count"]), int(entry["offset"]) + 8 * int(entry["count"]) * int(entry["objectives"])
+        offsets = np.ndarray(count, dtype="<i8", buffer=self.data, offset=offset)
+        start = offset + 8 * count
+        return decode_strings(self.data[start:start + int(entry["genotype_bytes"])], offsets)
+
+    def best_genotype(self, record):
+        entry = self.index[record]
+        if entry["best_index"] < 0:
+            return None
+        return self.genotypes(record)[int(entry["best_index"])]
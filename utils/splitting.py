@@ -0,0 +1,81 @@
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from evolalg.base.array_population import ArrayPopulation
+from evolalg.utils.pareto import selection_key
+
+# Splitting methods work on a fitness array and return index groups into the population the array was taken from.
+# A method is called as method(fitness, num_groups) and returns a list of num_groups integer index arrays.
+# Multi-objective fitness is split by its Pareto scores (see utils/pareto.py): "ena" then cuts the population sorted
+# by front (and crowding distance inside a front) into equal groups, and "ewa" gives every group an equal range of
+# fronts.
+SPLIT_METHODS: Dict[str, Callable[[np.ndarray, int], List[np.ndarray]]] = {}
+
+
+def register_split_method(name, method=None):
+    # works both as register_split_method("name", function) and as a @register_split_method("name") decorator
+    def register(function):
+        SPLIT_METHODS[name] = function
+        return function
+
+    if method is None:
+        return register
+    return register(method)
+
+
+@register_split_method("ena")
+def equal_number_allocation(fitness, num_groups):
+    # sorted by fitness, then cut into groups of (almost) equal size
+    order = np.argsort(fitness, kind="stable")
+    return np.array_split(order, num_groups)
+
+
+@register_split_method("era")
+def equal_random_allocation(fitness, num_groups):
+    # random groups of len(fitness) // num_groups individuals each, the remainder is left out
+    number_of_elements = len(fitness) // num_groups
+    permutation = np.random.permutation(len(fitness))
+    return [permutation[i * number_of_elements:(i + 1) * number_of_elements] for i in range(num_groups)]
+
+
+@register_split_method("ewa")
+def equal_width_allocation(fitness, num_groups):
+    # [0 ; x] (x ; 2x] ... ((n-1)x ; nx] - the pattern of dividing fitness into intervals.
+    # The first interval is closed from right and left to ensure that the first subpopulation
+    # will never be empty. Each subsequent interval is closed from left to ensure that
+    # the last interval never will lose the best solution.
+    intervals = np.linspace(fitness.min(), fitness.max(), num_groups + 1)
+    labels = np.digitize(fitness, intervals[1:-1], right=True)
+    order = np.argsort(labels, kind="stable")  # keeps the population order inside each group
+    counts = np.bincount(labels, minlength=num_groups)
+    res = np.split(order, np.cumsum(counts)[:-1])
+    # an empty interval gets the same individuals as the previous one
+    for i in range(1, num_groups):
+        if len(res[i]) == 0:
+            res[i] = res[i - 1]
+    return res
+
+
+def fitness_array(population, fit_attr="fitness"):
+    if isinstance(population, ArrayPopulation):
+        return population.fitness_array(fit_attr)
+    return np.fromiter((getattr(x, fit_attr) for x in population), dtype=float, count=len(population))
+
+
+def split_indices(fitness, splitting_method, num_groups):
+    try:
+        method = SPLIT_METHODS[splitting_method]
+    except KeyError:
+        raise ValueError("Unknown splitting method '%s', available: %s"
+                         % (splitting_method, ", ".join(sorted(SPLIT_METHODS)))) from None
+    return method(np.asarray(fitness), num_groups)
+
+
+def split_population(population, splitting_method, num_groups, fit_attr="fitness"):
+    # subpopulations hold references to the individuals of population, nothing is copied;
+    # an ArrayPopulation is split into ArrayPopulations holding the rows of each group
+    groups = split_indices(selection_key(population, fit_attr), splitting_method, num_groups)
+    if isinstance(population, ArrayPopulation):
+        return [population.take(group) for group in groups]
+    return [[population[i] for i in group] for group in groups]
@@ -1,37 +1,100 @@
-from collections import Iterable
+import math
+from collections.abc import Iterable
 
+from evolalg.base.array_population import ArrayPopulation
 from evolalg.base.step import Step
-import copy
 
 from evolalg.base.union_step import UnionStep
+from evolalg.utils.clone import clone_individual
+
+COUNTERS = ("calls", "rounds", "evaluations", "accepted", "rejected", "surplus")
 
 
 class StableGeneration(Step):
+    """Generates population_size new individuals, repeating selection and the steps while some steps
+    (e.g. FieldRemove of invalid individuals) reject offspring.
+
+    The rejection rate is tracked as an exponential moving average, separately for every stream (subpopulation),
+    and each round asks for missing / (1 - rejection rate) offspring so that the generation is usually complete
+    after one round. A generation that needs more than max_rounds rounds or max_evaluations offspring raises
+    RuntimeError. counters holds the totals: offspring sent through the steps (evaluations), accepted and rejected
+    by them, and accepted but not needed (surplus).
+    """
 
-    def __init__(self, selection, steps, population_size=None):
+    def __init__(self, selection, steps, population_size=None, copy_function=clone_individual,
+                 max_rounds=100, max_evaluations=None, smoothing=0.5, min_acceptance=0.05):
         self.selection = selection
         self.steps = UnionStep(steps)
         self.population_size = population_size
+        # parents are copied before the steps change them; pass copy.deepcopy if some step modifies fields in place
+        self.copy_function = copy_function
+        self.max_rounds = max_rounds  # None: no limit
+        self.max_evaluations = max_evaluations  # per generation, None: no limit
+        self.smoothing = smoothing  # weight of the last round in the rejection rate
+        self.min_acceptance = min_acceptance  # a round never asks for more than missing / min_acceptance offspring
+        self.rejection_rates = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
 
     def generate_new(self, population, missing_count):
         selected = self.selection(population, missing_count)
-        selected = copy.deepcopy(selected)
+        selected = [self.copy_function(x) for x in selected]
         selected = self.steps(selected)
         return selected
 
     def init(self):
         self.selection.init()
         self.steps.init()
+        self.rejection_rates = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def checkpoint_state(self):
+        # the rejection rates decide how many offspring are asked for, so a resumed run needs them
+        return {"rejection_rates": dict(self.rejection_rates)}
+
+    def restore_checkpoint_state(self, state):
+        self.rejection_rates = dict(state["rejection_rates"])
 
-    def call(self, population):
-        population_size = self.population_size
+    def batch_size(self, missing, stream=None):
+        acceptance = max(1.0 - self.rejection_rates.get(stream, 0.0), self.min_acceptance)
+        return math.ceil(missing / acceptance)
+
+    def observe_round(self, requested, accepted, stream=None):
+        rate = max(requested - accepted, 0) / requested
+        previous = self.rejection_rates.get(stream)
+        self.rejection_rates[stream] = rate if previous is None else \
+            self.smoothing * rate + (1 - self.smoothing) * previous
+
+    def call(self, population, stream=None, population_size=None):
+        # population_size overrides self.population_size for this call, e.g. with a budget from BudgetScheduler
+        if population_size is None:
+            population_size = self.population_size
         if population_size is None:
             population_size = len(population)
         generated = []
+        rounds = evaluations = 0
+        self.counters["calls"] += 1
         while len(generated) < population_size:
-            gen = self.generate_new(population, population_size - len(generated))
-            if isinstance(gen, Iterable):
-                generated.extend(gen)
-            else:
-                generated.append(gen)
-        return generated[:population_size]
+            missing = population_size - len(generated)
+            if self.max_rounds is not None and rounds >= self.max_rounds or \
+                    self.max_evaluations is not None and evaluations >= self.max_evaluations:
+                raise RuntimeError("StableGeneration: %d of %d individuals after %d rounds and %d evaluations, "
+                                   "the steps reject almost all offspring"
+                                   % (len(generated), population_size, rounds, evaluations))
+            requested = self.batch_size(missing, stream)
+            if self.max_evaluations is not None:
+                requested = max(min(requested, self.max_evaluations - evaluations), 1)
+            gen = self.generate_new(population, requested)
+            gen = list(gen) if isinstance(gen, Iterable) else [gen]
+            generated.extend(gen)
+            rounds += 1
+            evaluations += requested
+            self.observe_round(requested, len(gen), stream)
+            self.counters["rounds"] += 1
+            self.counters["evaluations"] += requested
+            self.counters["accepted"] += len(gen)
+            self.counters["rejected"] += max(requested - len(gen), 0)
+        self.counters["surplus"] += len(generated) - population_size
+        generated = generated[:population_size]
+        if isinstance(population, ArrayPopulation):
+            return ArrayPopulation.from_individuals(generated, population.numeric_fields)
+        return generated
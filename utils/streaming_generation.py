@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import math
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Callable
+
+from evolalg.base.array_population import ArrayPopulation
+from evolalg.base.step import Step
+from evolalg.base.union_step import UnionStep
+from evolalg.utils.clone import clone_individual
+from evolalg.utils.evaluator_pool import EvaluatorPool
+from evolalg.utils.stable_generation import COUNTERS
+
+
+class StreamingGeneration(Step):
+    """Pipelined alternative to StableGeneration.
+
+    The calling thread selects parents and applies the variation steps (e.g. FramsCrossAndMutate) batch by batch
+    and keeps up to queue_size batches in flight in an EvaluatorPool, so evaluators never wait for selection and
+    variation, and vice versa. The generation is complete as soon as population_size valid individuals arrived.
+    Batches still in flight at that moment are not thrown away, they are the first arrivals of the next call with
+    the same stream (subpopulation), so offspring never move to another island.
+
+    With steady_state=True every arriving individual immediately replaces the worst individual of the population
+    (if it is not worse), and selection keeps drawing from this updated population; the result is that population.
+    Otherwise (generational mode) the result are the population_size new individuals.
+
+    A call that produced max_rounds times the batches its population_size needs, or sent max_evaluations
+    individuals to the evaluators, and still has too few valid ones raises RuntimeError. counters holds the same
+    totals as StableGeneration.counters (a round is one batch).
+    """
+
+    def __init__(self, selection, steps, evaluator_factory: Callable, population_size=None, num_evaluators=2,
+                 batch_size=8, queue_size=None, use_processes=True, steady_state=False, fit_attr="fitness",
+                 copy_function=clone_individual, max_rounds=100, max_evaluations=None):
+        self.selection = selection
+        self.steps = UnionStep(steps)
+        self.population_size = population_size
+        self.batch_size = batch_size
+        self.queue_size = queue_size if queue_size is not None else 2 * num_evaluators
+        self.steady_state = steady_state
+        self.fit_attr = fit_attr
+        self.copy_function = copy_function
+        self.max_rounds = max_rounds  # None: no limit
+        self.max_evaluations = max_evaluations  # per call, None: no limit
+        self.evaluators = EvaluatorPool(evaluator_factory, num_evaluators, use_processes)
+        self._in_flight = {}  # stream -> {future: batch size} of the batches sent to the evaluators
+        self._arrived = {}  # stream -> deque of evaluated individuals not consumed yet
+        self._budget = (None, None)  # (batches, individuals) the current call may still produce
+        self.submitted = 0  # individuals sent to the evaluators
+        self.arrived = 0  # valid individuals that came back
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def init(self):
+        self.selection.init()
+        self.steps.init()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def produce(self, population):
+        selected = self.selection(population, self.batch_size)
+        selected = [self.copy_function(x) for x in selected]
+        return self.steps(selected)
+
+    def exhausted(self):
+        batches, evaluations = self._budget
+        return batches is not None and batches <= 0 or evaluations is not None and evaluations <= 0
+
+    def fill_queue(self, population, stream=None):
+        in_flight = self._in_flight.setdefault(stream, {})
+        while len(in_flight) < self.queue_size and not self.exhausted():
+            batch = self.produce(population)
+            batches, evaluations = self._budget
+            self._budget = (batches - 1 if batches is not None else None,
+                            evaluations - len(batch) if evaluations is not None else None)
+            self.counters["rounds"] += 1
+            if len(batch) > 0:
+                self.submitted += len(batch)
+                self.counters["evaluations"] += len(batch)
+                in_flight[self.evaluators.submit(batch)] = len(batch)
+
+    def arrivals(self, population, stream=None):
+        # yields evaluated, valid individuals of this stream as they come, producing new batches whenever one is
+        # consumed, until the budget of the call is used up
+        arrived = self._arrived.setdefault(stream, deque())
+        while True:
+            while arrived:
+                yield arrived.popleft()
+            self.fill_queue(population, stream)
+            in_flight = self._in_flight[stream]
+            if not in_flight:
+                raise RuntimeError("StreamingGeneration: budget of %s rounds and %s evaluations used up after %d "
+                                   "evaluations, the steps reject almost all offspring"
+                                   % (self.max_rounds, self.max_evaluations, self.counters["evaluations"]))
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                submitted = in_flight.pop(future)
+                valid = [ind for ind in future.result() if getattr(ind, self.fit_attr, None) is not None]
+                self.arrived += len(valid)
+                self.counters["accepted"] += len(valid)
+                self.counters["rejected"] += submitted - len(valid)
+                arrived.extend(valid)
+
+    def call(self, population, stream=None, population_size=None):
+        # stream: in-flight and arrived offspring are kept per stream (subpopulation);
+        # population_size overrides self.population_size for this call (in steady-state mode: the evaluations)
+        if population_size is None:
+            population_size = self.population_size
+        if population_size is None:
+            population_size = len(population)
+        self.counters["calls"] += 1
+        self._budget = (self.max_rounds * max(1, math.ceil(population_size / self.batch_size))
+                        if self.max_rounds is not None else None, self.max_evaluations)
+
+        if not self.steady_state:
+            generated = []
+            for ind in self.arrivals(population, stream):
+                generated.append(ind)
+                if len(generated) >= population_size:
+                    if isinstance(population, ArrayPopulation):
+                        return ArrayPopulation.from_individuals(generated, population.numeric_fields)
+                    return generated
+
+        original = population
+        population = list(population)
+        counter = itertools.count()
+        worst = [(getattr(ind, self.fit_attr), next(counter), index) for index, ind in enumerate(population)]
+        heapq.heapify(worst)
+        arrived = 0
+        for ind in self.arrivals(population, stream):
+            fitness = getattr(ind, self.fit_attr)
+            if fitness >= worst[0][0]:
+                _, _, index = heapq.heapreplace(worst, (fitness, next(counter), worst[0][2]))
+                population[index] = ind
+            arrived += 1
+            if arrived >= population_size:
+                if isinstance(original, ArrayPopulation):
+                    return ArrayPopulation.from_individuals(population, original.numeric_fields)
+                return population
+
+    def close(self):
+        self._in_flight = {}
+        self._arrived = {}
+        self.evaluators.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_in_flight"] = {}
+        state["_arrived"] = {}
+        return state
@@ -0,0 +1,140 @@
+import multiprocessing
+import random
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from evolalg.fitness.cached_fitness import find_cached_steps, sum_stats
+from evolalg.utils.instrumentation import Instrumentation, instrument_generation
+from evolalg.utils.stable_generation import COUNTERS, StableGeneration
+
+
+def derive_seed(seed, generation, stream):
+    # one independent, reproducible seed per (run seed, generation, stream)
+    return int(np.random.SeedSequence([seed, generation, stream]).generate_state(1)[0])
+
+
+def reseed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def _worker_loop(conn, worker_setup, population_size, instrumented, step_kwargs):
+    # Each worker builds its own selection and steps (and so its own FramsticksLib) once and keeps them
+    # for the whole run; afterwards only seeds and individuals (and timings, if instrumented) travel through the pipe.
+    selection, steps = worker_setup()
+    step = StableGeneration(selection=selection, steps=steps, population_size=population_size, **step_kwargs)
+    instrumentation = Instrumentation(enabled=instrumented)
+    if instrumented:
+        instrument_generation(step, instrumentation)
+    step.init()
+    cached_steps = find_cached_steps(step.steps)  # their evaluation cache statistics are reported with the counters
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        seed, population, (generation, index), size, rejection_rate = message
+        try:
+            if seed is not None:
+                reseed(seed)
+            if rejection_rate is not None:
+                step.rejection_rates[index] = rejection_rate
+            instrumentation.generation, instrumentation.subpopulation = generation, index
+            with instrumentation.measure("generation", population) as result:
+                result[0] = step(population, stream=index, population_size=size)
+            conn.send((True, result[0], instrumentation.take_rows(), step.counters, step.rejection_rates.get(index),
+                       sum_stats(s.stats() for s in cached_steps)))
+        except Exception as ex:
+            conn.send((False, repr(ex), [], None, None, None))
+    conn.close()
+
+
+class SubpopulationPool:
+    """Long-lived worker processes, one per subpopulation, each running its own StableGeneration step.
+
+    worker_setup is called once in every worker and must return (selection, new_generation_steps). It has to be
+    picklable (e.g. a module-level function or a functools.partial of one), because workers are spawned.
+    """
+
+    def __init__(self, worker_setup: Callable[[], Tuple], population_size, num_workers,
+                 instrumentation: Instrumentation = None, step_kwargs=None):
+        self.worker_setup = worker_setup
+        self.population_size = population_size
+        self.num_workers = num_workers
+        # when enabled, workers measure their stages too and the rows are merged into this instrumentation
+        self.instrumentation = instrumentation
+        self.step_kwargs = step_kwargs if step_kwargs is not None else {}  # further StableGeneration arguments
+        self.connections = []
+        self.processes = []
+        self.step_counters = {}  # worker index -> the last StableGeneration.counters it reported
+        self.rejection_rates = {}  # worker index -> its StableGeneration rejection rate after the last map()
+        self.cache_stats = {}  # worker index -> the last CachedFitnessStep statistics it reported, if it has a cache
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")  # a fresh interpreter per worker, no inherited native library state
+        for _ in range(self.num_workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker_loop,
+                                      args=(child_conn, self.worker_setup, self.population_size,
+                                            self.instrumentation is not None and self.instrumentation.enabled,
+                                            self.step_kwargs),
+                                      daemon=True)
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    def map(self, subpopulations: List[list], seeds: List, sizes: List[int] = None,
+            rejection_rates: dict = None) -> List[list]:
+        # rejection_rates (subpopulation index -> rate) are given to the workers, so that the estimates
+        # can be kept (and checkpointed) by the caller, whatever worker evolved a subpopulation before
+        if len(subpopulations) > len(self.connections):
+            raise ValueError("%d subpopulations but only %d workers" % (len(subpopulations), len(self.connections)))
+        # send everything first so that all workers evolve their subpopulations at the same time
+        generation = self.instrumentation.generation if self.instrumentation is not None else None
+        for index, (conn, subp, seed) in enumerate(zip(self.connections, subpopulations, seeds)):
+            conn.send((seed, subp, (generation, index), sizes[index] if sizes is not None else None,
+                       rejection_rates.get(index) if rejection_rates is not None else None))
+        res = []
+        for index, conn in enumerate(self.connections[:len(subpopulations)]):
+            ok, payload, rows, counters, rejection_rate, cache_stats = conn.recv()
+            if not ok:
+                raise RuntimeError("Worker of subpopulation %d failed: %s" % (index, payload))
+            if rows:
+                self.instrumentation.add_rows(rows)
+            self.step_counters[index] = counters
+            if rejection_rate is not None:
+                self.rejection_rates[index] = rejection_rate
+            if cache_stats is not None:
+                self.cache_stats[index] = cache_stats
+            res.append(payload)
+        return res
+
+    def counters(self):
+        # StableGeneration counters summed over all workers
+        return {name: sum(c[name] for c in self.step_counters.values()) for name in COUNTERS}
+
+    def evaluation_cache_stats(self):
+        # evaluation cache statistics summed over all workers, None if they have no cache
+        return sum_stats(self.cache_stats.values())
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(None)
+                conn.close()
+            except (OSError, EOFError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
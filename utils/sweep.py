@@ -0,0 +1,171 @@
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List
+
+
+def grid(parameters: Dict[str, list], seeds: List[int]) -> List[dict]:
+    # every combination of parameter values, once for every seed
+    names = list(parameters)
+    return [dict(zip(names, values), seed=seed)
+            for values in itertools.product(*(parameters[name] for name in names)) for seed in seeds]
+
+
+def run_id(config):
+    # stable name of a configuration, used for its checkpoint and log files and to find finished runs
+    return "_".join("%s=%s" % (name, config[name]) for name in config)
+
+
+def _sweep_worker(setup, run_experiment, connection):
+    # setup (e.g. loading FramsticksLib) happens once per worker, then the worker runs the experiments the parent
+    # sends until it gets None; results go back through the same pipe, which has no buffering thread that a crash
+    # could cut off
+    context = setup()
+    while True:
+        config = connection.recv()
+        if config is None:
+            break
+        try:
+            start = time.time()
+            result = run_experiment(context, config)
+            result["wall"] = time.time() - start
+            connection.send(("ok", result))
+        except Exception:
+            connection.send(("failed", traceback.format_exc()))
+    connection.close()
+
+
+class Sweep:
+    """Runs one experiment per configuration on num_workers long-lived worker processes.
+
+    setup() is called once in every worker and returns its context (e.g. a loaded FramsticksLib);
+    run_experiment(context, config) runs one configuration and returns a dict of results. Both are executed in
+    spawned processes, so they have to be picklable (module-level functions or functools.partial of them).
+    Every finished run is appended as one row (config, status and result_fields) to the CSV file results_path.
+    Runs already there with status "ok" are skipped, so an interrupted sweep is resumed by running it again;
+    run_experiment is expected to resume unfinished runs from their own checkpoints. A run whose worker died
+    (e.g. a crash of the native library) is recorded as failed and the worker is replaced.
+    """
+
+    def __init__(self, setup: Callable, run_experiment: Callable, num_workers=None, results_path="sweep.csv",
+                 result_fields=()):
+        self.setup = setup
+        self.run_experiment = run_experiment
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.results_path = results_path
+        self.result_fields = list(result_fields)
+
+    def finished(self):
+        if not os.path.exists(self.results_path):
+            return set()
+        with open(self.results_path, newline="") as file:
+            return {row["run"] for row in csv.DictReader(file) if row["status"] == "ok"}
+
+    def write_row(self, config, status, result):
+        fields = list(config) + ["run", "status"] + self.result_fields + ["wall", "error"]
+        row = dict(config, run=run_id(config), status=status)
+        if status == "ok":
+            row.update(result)
+        else:
+            row["error"] = result
+        new_file = not os.path.exists(self.results_path) or os.path.getsize(self.results_path) == 0
+        with open(self.results_path, "a", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=fields, extrasaction="ignore")
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+
+    def run(self, configs: List[dict]):
+        done = self.finished()
+        pending = {run_id(config): config for config in configs if run_id(config) not in done}
+        print("Sweep: %d runs, %d already finished, %d to run on %d workers"
+              % (len(configs), len(configs) - len(pending), len(pending), self.num_workers))
+        if not pending:
+            return
+        context = multiprocessing.get_context("spawn")
+        todo = list(pending.values())  # configurations not given to any worker yet
+        workers = {}  # worker id -> (process, connection); a replaced worker gets a new id
+        running = {}  # worker id -> configuration it is running, assigned here so a dead worker's run is known
+        worker_ids = itertools.count()
+        remaining = len(pending)
+
+        def assign(worker_id):
+            connection = workers[worker_id][1]
+            config = todo.pop(0) if todo else None
+            try:
+                connection.send(config)
+            except OSError:  # the worker is already dead, its death is handled by its sentinel
+                if config is not None:
+                    todo.insert(0, config)
+                return
+            if config is not None:
+                running[worker_id] = config
+
+        def start_worker():
+            worker_id = next(worker_ids)
+            parent_end, worker_end = context.Pipe()
+            process = context.Process(target=_sweep_worker, args=(self.setup, self.run_experiment, worker_end),
+                                      daemon=True)
+            process.start()
+            worker_end.close()
+            workers[worker_id] = (process, parent_end)
+            assign(worker_id)
+
+        def finish(worker_id, status, payload):
+            nonlocal remaining
+            config = running.pop(worker_id)
+            remaining -= 1
+            self.write_row(config, status, payload)
+            print("Sweep: %s %s (%d left)" % (run_id(config), status, remaining))
+
+        for _ in range(min(self.num_workers, len(pending))):
+            start_worker()
+        try:
+            while remaining > 0:
+                connections = {connection: worker_id for worker_id, (_, connection) in workers.items()}
+                sentinels = {process.sentinel: worker_id for worker_id, (process, _) in workers.items()}
+                ready = wait(list(connections) + list(sentinels))
+                for connection in ready:
+                    worker_id = connections.get(connection)
+                    if worker_id is None:
+                        continue
+                    try:
+                        status, payload = connection.recv()
+                    except (EOFError, OSError):  # the worker died, see below
+                        continue
+                    finish(worker_id, status, payload)
+                    assign(worker_id)
+                for sentinel in ready:
+                    worker_id = sentinels.get(sentinel)
+                    if worker_id is None:
+                        continue
+                    process, connection = workers.pop(worker_id)
+                    # a result sent right before the worker died is still in the pipe
+                    try:
+                        while worker_id in running and connection.poll():
+                            status, payload = connection.recv()
+                            finish(worker_id, status, payload)
+                    except (EOFError, OSError):
+                        pass
+                    connection.close()
+                    process.join()
+                    if worker_id in running:
+                        print("Sweep: the worker running %s died" % run_id(running[worker_id]))
+                        finish(worker_id, "failed", "worker exited with code %s" % process.exitcode)
+                    if todo:
+                        start_worker()
+        finally:
+            for process, connection in workers.values():
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+            for process, connection in workers.values():
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+                connection.close()